@@ -0,0 +1,116 @@
+"""
+Directory discovery benchmark, DirectoryRanker against the old keyword match of find_directories
+over a labeled set of subwebsite link lists (the layouts of common district CMSs).
+
+Reports per method: candidates, recall of the labeled staff directories, and the directory pages
+fetched per subwebsite when the crawl stops at the first staff directory (directory_early_stop).
+
+Run from src/:
+    python -m bench.discovery
+"""
+from bs4 import BeautifulSoup
+
+from main import DirectoryRanker, colors
+
+
+# (links as (href, anchor text), hrefs that are staff directories)
+LABELED = [
+    (
+        [("/", "Home"), ("/about-us", "About Us"), ("/board/meetings/2023-09-minutes.pdf", "Board Minutes"),
+         ("/board/members", "Board Members"), ("/departments/athletics/news", "Athletics News"),
+         ("/staff-directory", "Staff Directory"), ("/calendar", "Calendar")],
+        {"/staff-directory"},
+    ),
+    (
+        [("/apps/pages/index.jsp?uREC_ID=1&type=d", "Departments"), ("/apps/staff/", "Staff"),
+         ("/apps/events/", "Events"), ("/apps/news/", "News"), ("/apps/pages/board-agenda", "Board Agendas")],
+        {"/apps/staff/"},
+    ),
+    (
+        [("/our-school/faculty-staff", "Faculty & Staff"), ("/our-school/faculty-handbook.pdf", "Faculty Handbook"),
+         ("/parents/lunch-menu", "Lunch Menu"), ("/employment", "Employment Opportunities"),
+         ("/departments/special-education", "Special Education")],
+        {"/our-school/faculty-staff"},
+    ),
+    (
+        [("/Page/2", "Home"), ("/domain/45", "Teachers"), ("/Page/88", "Staff Directory"),
+         ("/site/default.aspx?PageID=5", "Board of Education"), ("/Page/90", "Lunch")],
+        {"/domain/45", "/Page/88"},
+    ),
+    (
+        [("https://www.example-county.k12.al.us/teachers", "Teacher Pages"),
+         ("https://www.example-county.k12.al.us/board-policies", "Board Policies"),
+         ("https://www.example-county.k12.al.us/department-of-transportation", "Transportation"),
+         ("https://www.example-county.k12.al.us/staff-login", "Staff Login"),
+         ("https://www.example-county.k12.al.us/directory", "Directory")],
+        {"https://www.example-county.k12.al.us/teachers", "https://www.example-county.k12.al.us/directory"},
+    ),
+    (
+        [("/about/administration", "Administration"), ("/about/staff", "Our Staff"),
+         ("/news/staff-spotlight-2023", "Staff Spotlight"), ("/board/meeting-schedule", "Board Meeting Schedule"),
+         ("/contact-us", "Contact Us")],
+        {"/about/staff"},
+    ),
+    (
+        [("/o/central/page/employee-directory", "Employee Directory"), ("/o/central/page/jobs", "Jobs"),
+         ("/o/central/page/board-of-education", "Board of Education"), ("/o/central/events", "Events"),
+         ("/o/central/page/staff-resources", "Staff Resources")],
+        {"/o/central/page/employee-directory"},
+    ),
+    (
+        [("/faculty", "Faculty"), ("/staff", "Staff"), ("/department-heads", "Department Heads"),
+         ("/board", "Board"), ("mailto:office@example.org", "Email the office")],
+        {"/faculty", "/staff", "/department-heads"},
+    ),
+    (
+        [("/index.php?page=home", "Home"), ("/index.php?page=staff", "Our People"),
+         ("/index.php?page=news&id=12", "Latest News"), ("/index.php?page=calendar&view=month", "Calendar"),
+         ("/index.php?option=com_content&view=article&id=7", "About the School")],
+        {"/index.php?page=staff"},
+    ),
+]
+
+KEYWORDS = ['staff', 'faculty', 'teachers', 'board', 'department'] # the old find_directories
+
+
+def links_soup(links):
+    return BeautifulSoup("".join(f'<a href="{href}">{text}</a>' for href, text in links), "html.parser")
+
+
+def old_method(links):
+    return [href for href, text in links if any(keyword in href for keyword in KEYWORDS)]
+
+
+def new_method(links):
+    return [halflink for score, halflink in DirectoryRanker.rank(links_soup(links))]
+
+
+# Directory pages fetched until the first labeled directory, all of them if there is none
+def fetched(candidates, labels):
+    for position, candidate in enumerate(candidates):
+        if candidate in labels:
+            return position + 1
+    return len(candidates)
+
+
+def evaluate(method):
+    candidates, found, labeled, pages = 0, 0, 0, 0
+    for links, labels in LABELED:
+        ranked = method(links)
+        candidates += len(ranked)
+        found += len(labels.intersection(ranked))
+        labeled += len(labels)
+        pages += fetched(ranked, labels)
+    return {"candidates": candidates, "recall": found / labeled, "pages": pages}
+
+
+def main():
+    print(f"{colors.HEADER}{len(LABELED)} labeled subwebsites{colors.ENDC}")
+    print(f"  {'method':<18} {'candidates':>10} {'recall':>8} {'pages to first directory':>26}")
+    for name, method in (("keywords (old)", old_method), ("DirectoryRanker", new_method)):
+        result = evaluate(method)
+        print(f"  {name:<18} {result['candidates']:>10} {result['recall']:>8.0%} {result['pages']:>26}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+End-to-end benchmark, drives Scrapper.scrape over a synthetic district served locally
+(see bench/fixtures.py) and reports pages/sec, records/sec, peak RSS and per-stage timings.
+
+Run from src/:
+    python -m bench.district                         # default fixture
+    python -m bench.district --rows 2000 --latency 0.2
+    python -m bench.district --save default          # store as bench/baselines/default.json
+    python -m bench.district --compare default       # exit status 1 on a regression
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from main import Scrapper, Utility, JsonlSink, Metrics, colors
+from bench.fixtures import FixtureDistrict, start_server
+
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+TOLERANCE = 0.10 # relative change that counts as a regression
+
+
+# Peak resident set size of this process in MB
+def peak_rss():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+def run(district, base, served, settings):
+    with tempfile.TemporaryDirectory() as temp:
+        settings = {
+            "http_cache": False,
+            "politeness": False,
+            "max_per_host": 16,
+            "directory_early_stop": False, # every fixture directory has tables, crawl them all
+            "districts_path": os.path.join(temp, "districts.db"),
+            "output_path": os.path.join(temp, "data.jsonl"),
+            **settings,
+        }
+        scrapper = Scrapper(metrics=True, **settings)
+        # the district sheet, for Parser.process_implications, with a decoy district in the first row
+        # so the fixture's id (its position in Utility.get_urls) has to be mapped back to its row
+        Utility.df = pd.DataFrame({
+            "district_name": ["Decoy District", "Fixture District"],
+            "district_url": [f"{base}/wiki/decoy", f"{base}/wiki/district"],
+            "website_1": [None, base],
+            "website_2": [f"{base}/decoy", None],
+            "website_3": [None, None],
+            "website_4": [None, None],
+            "website_5": [None, None],
+        })
+        Utility.urls = None
+        id = Utility.get_urls().index(base) + 1
+        sink = JsonlSink(**settings)
+
+        pages_before = served.value
+        snapshot = Metrics.snapshot()
+        start = time.perf_counter()
+        records = 0
+        mislabeled = 0
+        for record in scrapper.scrape_iter(base, id, silent=True, log_info=False):
+            sink.write(record, url=base)
+            records += 1
+            mislabeled += record.district != "Fixture District" or record.school != "Fixture High School"
+        sink.close()
+        elapsed = time.perf_counter() - start
+        pages = served.value - pages_before
+        stages = Metrics.since(snapshot)["stages"]
+        scrapper.close()
+
+    return {
+        "elapsed": elapsed,
+        "pages": pages,
+        "records": records,
+        "mislabeled": mislabeled,
+        "pages_per_sec": pages / elapsed,
+        "records_per_sec": records / elapsed,
+        "peak_rss_mb": peak_rss(),
+        "stages": {stage: timing["seconds"] for stage, timing in stages.items()},
+        "calls": {stage: timing["calls"] for stage, timing in stages.items()},
+    }
+
+
+def report(result, expected):
+    print(f"{colors.HEADER}{result['pages']} pages, {result['records']} records in {result['elapsed']:.2f}s{colors.ENDC}")
+    if result["records"] != expected:
+        print(f"{colors.WARNING}expected {expected} records{colors.ENDC}")
+    if result["mislabeled"]:
+        print(f"{colors.FAIL}{result['mislabeled']} records with the wrong district or school name{colors.ENDC}")
+    print(f"  pages/sec    {result['pages_per_sec']:10.1f}")
+    print(f"  records/sec  {result['records_per_sec']:10.1f}")
+    print(f"  peak RSS     {result['peak_rss_mb']:10.1f} MB")
+    print("  stages (see Metrics, they overlap: fetches run concurrently and table extraction fetches and parses):")
+    for stage, total in result["stages"].items():
+        print(f"    {stage:<18} {total:8.3f}s  {result['calls'][stage]:>6} calls")
+
+
+def compare(result, name):
+    with open(os.path.join(BASELINES, f"{name}.json"), "r") as f:
+        baseline = json.loads(f.read())
+
+    if baseline["fixture"] != result["fixture"]:
+        print(f"{colors.WARNING}baseline '{name}' was taken with a different fixture: {baseline['fixture']}{colors.ENDC}")
+
+    # faster but scraping something else is not an improvement
+    regressed = baseline["records"] != result["records"]
+    color = colors.FAIL if regressed else colors.OKGREEN
+    print(f"{color}  {'records':<16} {baseline['records']:10d} -> {result['records']:10d}{colors.ENDC}")
+
+    # metric -> whether higher is better
+    for metric, higher in (("pages_per_sec", True), ("records_per_sec", True), ("peak_rss_mb", False)):
+        old, new = baseline[metric], result[metric]
+        change = (new - old) / old if old else 0.0
+        worse = change < -TOLERANCE if higher else change > TOLERANCE
+        regressed = regressed or worse
+
+        color = colors.FAIL if worse else colors.OKGREEN
+        print(f"{color}  {metric:<16} {old:10.1f} -> {new:10.1f} ({change:+.1%}){colors.ENDC}")
+
+    return not regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subwebsites", type=int, default=10)
+    parser.add_argument("--directories", type=int, default=2)
+    parser.add_argument("--tables", type=int, default=1)
+    parser.add_argument("--rows", type=int, default=200)
+    parser.add_argument("--contacts", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every response")
+    parser.add_argument("--dead", type=int, default=0, help="subwebsites on a tarpitting host")
+    parser.add_argument("--flaky", type=int, default=0, help="every n-th response is a 503")
+    parser.add_argument("--repeat", type=int, default=3, help="runs, the fastest one is reported")
+    parser.add_argument("--settings", type=json.loads, default={}, help="Scrapper settings as JSON")
+    parser.add_argument("--save", metavar="NAME", help="save the result as a baseline")
+    parser.add_argument("--compare", metavar="NAME", help="compare against a saved baseline")
+    args = parser.parse_args(argv)
+
+    district = FixtureDistrict(args.subwebsites, args.directories, args.tables, args.rows, args.contacts, args.latency, args.dead, args.flaky)
+    process, base, served = start_server(district)
+    try:
+        results = [run(district, base, served, args.settings) for _ in range(args.repeat)]
+    finally:
+        process.terminate()
+
+    result = max(results, key=lambda r: r["pages_per_sec"])
+    result["fixture"] = district.settings()
+    result["settings"] = args.settings
+    result["machine"] = {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()}
+    report(result, district.expected_records())
+
+    ok = True
+    if args.compare:
+        ok = compare(result, args.compare)
+    if args.save:
+        os.makedirs(BASELINES, exist_ok=True)
+        with open(os.path.join(BASELINES, f"{args.save}.json"), "w") as f:
+            f.write(json.dumps(result, indent=2))
+
+    return 0 if ok and not result["mislabeled"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+Synthetic district website, served from a local HTTP server for the benchmarks.
+
+Layout, matching what Scrapper.scrape looks for:
+    /                               homepage, links to every school subwebsite
+    /school-<s>                     subwebsite, links to its staff directories
+    /school-<s>/<keyword>           directory (keywords from Scrapper.find_directories),
+                                    with iframe-embedded staff tables and mailto layouts
+    /embed/<s>/<d>/<t>              staff table shown in an iframe
+    /wiki/district                  district page with the #firstHeading school name
+"""
+import http.server
+import multiprocessing
+import time
+
+
+class FixtureDistrict:
+    keywords = ["staff-directory", "faculty", "teachers", "board", "department"]
+
+    def __init__(self, subwebsites=10, directories=2, tables=1, rows=200, contacts=20, latency=0.05, dead=0, flaky=0):
+        self.subwebsites = subwebsites # school subwebsites on the homepage
+        self.directories = directories # directories per subwebsite
+        self.tables = tables # iframe tables per directory
+        self.rows = rows # staff per table
+        self.contacts = contacts # mailto contacts per directory, in extr_match layouts
+        self.latency = latency # seconds added to every response
+        self.dead = dead # subwebsites on their own tarpitting host, their pages never answer
+        self.flaky = flaky # every n-th response is a 503, 0 for none
+
+    def settings(self):
+        return dict(vars(self))
+
+    # Staff records the pipeline should produce for the whole district, table rows and mailto contacts
+    def expected_records(self):
+        return (self.subwebsites - self.dead) * self.directories * (self.tables * self.rows + self.contacts)
+
+    # Dead subwebsites are linked through "localhost", a host of their own for the scrapper
+    def homepage(self, base):
+        dead = base.replace("127.0.0.1", "localhost")
+        links = "".join(f'<li><a href="{dead if s < self.dead else base}/school-{s}">School {s}</a></li>' for s in range(self.subwebsites))
+        return f"<html><body><h1>Fixture District</h1><ul>{links}</ul><a href=\"/about\">About</a></body></html>"
+
+    def subwebsite(self, s):
+        links = "".join(f'<a href="{FixtureDistrict.keywords[d % 5]}-{d}">Directory {d}</a>' for d in range(self.directories))
+        return f"<html><body><nav>{links}</nav><p>Welcome to school {s}</p><a href=\"/calendar\">Calendar</a></body></html>"
+
+    def directory(self, base, s, d):
+        iframes = "".join(f'<iframe src="{base}/embed/{s}/{d}/{t}"></iframe>' for t in range(self.tables))
+
+        # the three layouts Extractor.extr_match has patterns for
+        contacts = []
+        for c in range(self.contacts):
+            email = f"contact{c}.s{s}d{d}@fixture.k12.al.us"
+            if c % 3 == 0:
+                contacts.append(f'<table><tr><td><strong>Contact {c}</strong></td><td><a href="mailto:{email}">{email}</a></td></tr></table>')
+            elif c % 3 == 1:
+                contacts.append(f'<table><tr><td><strong>Contact {c}</strong><table><tr><td><a href="mailto:{email}">{email}</a></td></tr></table></td></tr></table>')
+            else:
+                contacts.append(f'<div><span>Contact {c}</span></div><div><span><a href="mailto:{email}">{email}</a></span></div>')
+
+        return f"<html><body><h2>Staff Directory</h2>{iframes}{''.join(contacts)}</body></html>"
+
+    def table(self, s, d, t):
+        jobs = ["Teacher", "Principal", "Counselor", "Coach", "Librarian"]
+        rows = "".join(
+            f"<tr><td>Last{r}, First{s}x{d}x{t}</td><td>{jobs[r % 5]}</td><td>user{r}.s{s}d{d}t{t}@fixture.k12.al.us</td><td>(205) 555-{r % 10000:04d}</td></tr>"
+            for r in range(self.rows)
+        )
+        return f"<html><body><table><tr><td>Staff Name</td><td>Job Title</td><td>Email</td><td>Phone</td></tr>{rows}</table></body></html>"
+
+    # Page for `path`, or None
+    def page(self, base, path):
+        parts = [part for part in path.split("?")[0].split("/") if part]
+        if not parts:
+            return self.homepage(base)
+        if parts == ["wiki", "district"]:
+            return '<html><body><h1 id="firstHeading">Fixture High School</h1></body></html>'
+        if parts[0] == "embed" and len(parts) == 4:
+            return self.table(*parts[1:])
+        if parts[0].startswith("school-"):
+            s = parts[0][len("school-"):]
+            if len(parts) == 1:
+                return self.subwebsite(s)
+            if len(parts) == 2:
+                return self.directory(base, s, parts[1].rsplit("-", 1)[-1])
+        return None
+
+
+class FixtureHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive, like real district sites
+
+    def do_GET(self):
+        district = self.server.district
+        time.sleep(district.latency)
+
+        host = self.headers.get("Host", f"127.0.0.1:{self.server.server_port}")
+        if host.startswith("localhost") and self.path != "/robots.txt":
+            time.sleep(60) # tarpit
+            return
+
+        with self.server.served.get_lock():
+            self.server.served.value += 1
+            served = self.server.served.value
+
+        body = district.page(f"http://{host}", self.path)
+        status = 200 if body is not None else 404
+        if district.flaky and served % district.flaky == 0:
+            status, body = 503, None
+        body = (body or "not found").encode()
+
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(district, port, ready, served):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), FixtureHandler)
+    server.daemon_threads = True
+    server.district = district
+    server.served = served
+    ready.put(server.server_port)
+    server.serve_forever()
+
+
+# Serve `district` from its own process, so it doesnt count towards the scrapper's CPU and memory
+# Returns (process, base url, shared counter of pages served)
+def start_server(district, port=0):
+    ready = multiprocessing.Queue()
+    served = multiprocessing.Value("i", 0)
+    process = multiprocessing.Process(target=serve, args=(district, port, ready, served), daemon=True)
+    process.start()
+
+    return process, f"http://127.0.0.1:{ready.get(timeout=10)}", served
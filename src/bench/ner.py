@@ -0,0 +1,62 @@
+"""
+NER micro-benchmark, Extractor.extr_ner over a synthetic staff directory without tables
+(staff cards, the layout the NER fallback is for). Reports blocks/sec and people found.
+
+Needs a spaCy model, en_core_web_md by default (see Utility.get_nlp).
+
+Run from src/:
+    python -m bench.ner
+    python -m bench.ner --cards 2000 --batch-size 128 --processes 2
+"""
+import argparse
+import time
+
+from main import Utility, Extractor, colors
+
+
+FIRST = ["Mary", "James", "Patricia", "Robert", "Linda", "Michael", "Barbara", "William", "Susan", "David"]
+LAST = ["Johnson", "Williams", "Brown", "Davis", "Miller", "Wilson", "Moore", "Taylor", "Anderson", "Thomas"]
+JOBS = ["Principal", "Math Teacher", "Counselor", "Head Coach", "Librarian", "School Nurse", "Secretary"]
+
+
+def staff_cards(cards):
+    html = []
+    for c in range(cards):
+        name = f"{FIRST[c % 10]} {LAST[c // 10 % 10]}"
+        email = f"{FIRST[c % 10].lower()}.{LAST[c // 10 % 10].lower()}{c}@fixture.k12.al.us"
+        html.append(
+            f'<div class="staff-card"><h3>{name}</h3><span>{JOBS[c % 7]}</span>'
+            f'<a href="mailto:{email}">Email</a></div>'
+        )
+    return f"<html><body><nav><a href=\"/\">Home</a></nav>{''.join(html)}</body></html>"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cards", type=int, default=500)
+    parser.add_argument("--model", default="en_core_web_md")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--processes", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    nlp = Utility.get_nlp(args.model)
+    soup = Utility.make_soup(staff_cards(args.cards))
+    blocks = len(Extractor.ner_candidates(soup))
+
+    # all components, one doc at a time, the way the stub called nlp
+    start = time.perf_counter()
+    for text, emails, segments in Extractor.ner_candidates(soup):
+        nlp(text)
+    full = time.perf_counter() - start
+
+    start = time.perf_counter()
+    people = Extractor.extr_ner(nlp, soup, batch_size=args.batch_size, n_process=args.processes)
+    trimmed = time.perf_counter() - start
+
+    print(f"{colors.HEADER}{blocks} blocks, {len(people)} people found ({args.cards} cards){colors.ENDC}")
+    print(f"  full pipeline, nlp(text)   {blocks / full:10.1f} blocks/sec")
+    print(f"  extr_ner, trimmed pipe     {blocks / trimmed:10.1f} blocks/sec ({full / trimmed:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Proxy pool benchmark, fetches fixture pages through local stand-in proxies.
+
+Every stand-in proxy forwards at most `--rate` requests per second, like a site rate limiting per IP,
+so throughput should grow with the number of healthy proxies. One extra proxy entry points at a closed
+port and should get evicted, and proxies.txt gets a blank line and a malformed entry the parser must skip.
+
+Run from src/:
+    python -m bench.proxies
+    python -m bench.proxies --proxies 1 2 4 8 --pages 200 --rate 10
+"""
+import argparse
+import http.server
+import multiprocessing
+import os
+import socket
+import tempfile
+import threading
+import time
+import urllib.request
+
+from main import Fetcher, Metrics, colors
+from bench.fixtures import FixtureDistrict, start_server
+
+
+class ProxyHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    # GET http://host/path, forwarded once the proxy's rate allows it
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            slot = max(time.monotonic(), server.next_slot)
+            server.next_slot = slot + 1 / server.rate
+        time.sleep(max(0.0, slot - time.monotonic()))
+
+        try:
+            with urllib.request.urlopen(self.path, timeout=10) as r:
+                status, body = r.status, r.read()
+        except Exception:
+            status, body = 502, b"bad gateway"
+
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve_proxy(rate, ready):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), ProxyHandler)
+    server.daemon_threads = True
+    server.rate = rate
+    server.lock = threading.Lock()
+    server.next_slot = 0.0
+    ready.put(server.server_port)
+    server.serve_forever()
+
+
+# Start `count` stand-in proxies, each in its own process
+# Returns (processes, ports)
+def start_proxies(count, rate):
+    processes, ports = [], []
+    for _ in range(count):
+        ready = multiprocessing.Queue()
+        process = multiprocessing.Process(target=serve_proxy, args=(rate, ready), daemon=True)
+        process.start()
+        processes.append(process)
+        ports.append(ready.get(timeout=10))
+    return processes, ports
+
+
+def closed_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run(base, ports, pages, temp):
+    path = os.path.join(temp, f"proxies-{len(ports)}.txt")
+    with open(path, "w") as f:
+        for port in ports:
+            f.write(f"http: 127.0.0.1:{port} https: 127.0.0.1:{port}\n\n")
+        f.write(f"127.0.0.1:{closed_port()}\n") # dead proxy, evicted after a few errors
+        f.write("http: not a proxy\n") # malformed, skipped
+
+    fetcher = Fetcher(proxies=True, proxies_path=path, politeness=False, max_per_host=64, max_connections=64, proxy_check_interval=3600)
+    urls = [f"{base}/embed/{p}/0/0" for p in range(pages)]
+
+    snapshot = Metrics.snapshot()
+    start = time.perf_counter()
+    results = fetcher.get_pages(urls)
+    elapsed = time.perf_counter() - start
+    report = fetcher.proxies.report()
+    counters = Metrics.since(snapshot)["counters"]
+    fetcher.close()
+
+    failed = sum(1 for result in results if isinstance(result, Exception))
+    return elapsed, failed, report, counters
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--proxies", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--pages", type=int, default=120)
+    parser.add_argument("--rate", type=float, default=10, help="requests per second each proxy forwards")
+    args = parser.parse_args(argv)
+
+    Metrics.configure(metrics=True)
+    process, base, served = start_server(FixtureDistrict(rows=20, latency=0.01))
+    processes, ports = start_proxies(max(args.proxies), args.rate)
+    try:
+        with tempfile.TemporaryDirectory() as temp:
+            print(f"{colors.HEADER}{args.pages} pages, each proxy forwards {args.rate:g} requests/sec{colors.ENDC}")
+            for count in args.proxies:
+                elapsed, failed, report, counters = run(base, ports[:count], args.pages, temp)
+                print(f"  {count} proxies  {args.pages / elapsed:8.1f} pages/sec  {failed} failed  evicted: {counters.get('proxies evicted', 0)}")
+                print(f"    {report}")
+    finally:
+        process.terminate()
+        for proxy in processes:
+            proxy.terminate()
+
+
+if __name__ == "__main__":
+    main()
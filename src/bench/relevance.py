@@ -0,0 +1,69 @@
+"""
+Micro-benchmark for TableUtil.is_relevant over large synthetic staff tables.
+Compares it against the old row-by-row version.
+
+Run from src/:
+    python -m bench.relevance
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from main import TableUtil
+
+
+# The old TableUtil.is_relevant, renders every row to a string
+def is_relevant_rowwise(table):
+    keywords = ["name", "grade", "title", "job", "city", "email", "position"]
+    relevant = False
+    for index, row in table.iterrows():
+        for keyword in keywords:
+            if keyword in row.to_string().lower():
+                relevant = True
+
+    return relevant
+
+
+# Staff table like pd.read_html gives, integer columns with the header in the first row
+def staff_table(rows):
+    rng = np.random.default_rng(0)
+    first = np.array(["Ray", "Elizabeth", "John", "Maria", "Li"])
+    last = np.array(["Wilson", "Shaddix", "Smith", "Garcia", "Chen"])
+    jobs = np.array(["Teacher", "Principal", "Counselor", "Coach", "Librarian"])
+
+    data = {
+        0: ["Staff Name"] + [f"{l}, {f}" for f, l in zip(rng.choice(first, rows), rng.choice(last, rows))],
+        1: ["Job Title"] + list(rng.choice(jobs, rows)),
+        2: ["Email"] + [f"user{i}@district.k12.al.us" for i in range(rows)],
+        3: ["Phone"] + [f"(205) 555-{i % 10000:04d}" for i in range(rows)],
+        4: ["Room"] + [str(i % 300) for i in range(rows)],
+        5: ["Grade"] + [str(i % 12 + 1) for i in range(rows)],
+    }
+    return pd.DataFrame(data)
+
+
+def timeit(func, table, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(table)
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def main(sizes=(100, 2000, 20000)):
+    print(f"{'rows':>8} {'rowwise':>12} {'is_relevant':>12} {'speedup':>9}")
+    for rows in sizes:
+        table = staff_table(rows)
+        repeat = 3 if rows > 5000 else 10
+
+        old = timeit(is_relevant_rowwise, table, 1 if rows > 5000 else 3)
+        new = timeit(TableUtil.is_relevant, table, repeat)
+        print(f"{rows:>8} {old * 1000:>10.2f}ms {new * 1000:>10.3f}ms {old / new:>8.0f}x")
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or (100, 2000, 20000))
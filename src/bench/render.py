@@ -0,0 +1,46 @@
+"""
+Render profile benchmark, renders pages in headless Chrome with the lean profile and with Chrome
+defaults, and reports wall time and bytes transferred per render (see Utility.get_selenium).
+
+Needs Chrome and chromedriver. Pass real directory or iframe urls, district pages are where
+images, fonts, trackers and embeds weigh in:
+    python -m bench.render https://www.example.k12.al.us/staff-directory
+    python -m bench.render --repeat 3 URL [URL ...]
+"""
+import argparse
+
+from main import Utility, DriverPool, Metrics, colors
+
+
+def run(urls, lean, repeat):
+    Utility.http_cache = None # every render goes to the network
+    Utility.driver_pool = DriverPool(lean_render=lean, driver_pool_size=1)
+    Utility.get_selenium(urls[0]) # start Chrome outside of the numbers
+
+    snapshot = Metrics.snapshot()
+    for _ in range(repeat):
+        for url in urls:
+            Utility.get_selenium(url)
+    since = Metrics.since(snapshot)
+    Utility.driver_pool.close()
+
+    renders = len(urls) * repeat
+    render = since["stages"].get("browser render", {"seconds": 0.0})
+    return render["seconds"] / renders, since["counters"].get("render bytes", 0) / renders, since["counters"].get("render timeouts", 0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("urls", nargs="+")
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    Metrics.configure(metrics=True)
+    print(f"{colors.HEADER}{len(args.urls)} pages x {args.repeat}{colors.ENDC}")
+    for name, lean in (("chrome defaults", False), ("lean profile", True)):
+        seconds, transferred, timeouts = run(args.urls, lean, args.repeat)
+        print(f"  {name:<16} {seconds:8.2f}s/render  {transferred / 1024:10.1f} KB/render  {timeouts} timeouts")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,44 @@
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 import pandas as pd
-import selenium
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.remote.remote_connection import LOGGER
-from selenium.webdriver.common.by import By
-import spacy
-from spacy.cli import download
-
-from time import sleep
+
+from time import sleep, monotonic
 from io import StringIO
+from contextlib import contextmanager
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
 import numpy as np
 import json
+import csv
+import os
+import sys
+import subprocess
+import importlib.util
+import time
+import hashlib
+import math
+import random
+import re
+import email.utils
+import http.server
+import urllib.robotparser
+import sqlite3
+import asyncio
+import threading
+import queue
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import atexit
+import multiprocessing
+import aiohttp
 
 
 ### Preload code
+## Heavy dependencies (the Excel sheet, Selenium, the spaCy model) are loaded on first use,
+## so importing this module stays cheap for worker processes
 
-# Load the file
 file_path = "./district_domains.xlsx"
-df = pd.read_excel(file_path)
-
-# Get all urls in the file
-urls = []
-for web_number in ["website_1", "website_2", "website_3", "website_4", "website_5"]:
-    for url in df[web_number].dropna().tolist():
-        urls.append(url)
-
-
+cold_start_budget = 1.5 # seconds `import main` may take, see check_cold_start
 
 
 ### Meta Classes
@@ -44,59 +55,438 @@ class colors:
     BOLD = '\033[1m'
     UNDERLINE = '\033[4m'
 
+## Metrics
+## Per-stage timers and counters for the scrape pipeline, with a JSON lines trace and a
+## Prometheus text endpoint. Disabled by default, then `Metrics.stage` hands out one shared
+## no-op context, so instrumented code costs next to nothing
+class NullStage:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class Stage:
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        Metrics.record(self.name, monotonic() - self.start, **self.labels)
+        return False
+
+
+class Metrics:
+    enabled = False
+    null_stage = NullStage()
+    lock = threading.Lock()
+    totals = {} # stage -> [seconds, calls]
+    hosts = {} # host -> [fetch seconds, requests]
+    counters = {} # name -> value
+    trace = None # open JSON lines file every stage is written to
+    server = None # Prometheus endpoint
+
+    # Set up from the scrapper settings: `metrics` turns it on, `metrics_trace` is a trace file path,
+    # `metrics_port` serves Prometheus text on http://127.0.0.1:<port>/metrics
+    def configure(**kwargs):
+        Metrics.enabled = bool(kwargs.get("metrics", False) or kwargs.get("metrics_trace") or kwargs.get("metrics_port"))
+        if kwargs.get("metrics_trace") and Metrics.trace is None:
+            Metrics.trace = open(kwargs["metrics_trace"], "a", encoding="utf-8")
+        if kwargs.get("metrics_port") and Metrics.server is None:
+            Metrics.serve(kwargs["metrics_port"])
+
+    # Time a `with` block as `name`, labels (eg host) go to the trace
+    def stage(name, **labels):
+        if not Metrics.enabled:
+            return Metrics.null_stage
+        return Stage(name, labels)
+
+    def record(name, seconds, **labels):
+        with Metrics.lock:
+            total = Metrics.totals.setdefault(name, [0.0, 0])
+            total[0] += seconds
+            total[1] += 1
+
+            host = labels.get("host")
+            if name == "fetch" and host is not None:
+                total = Metrics.hosts.setdefault(host, [0.0, 0])
+                total[0] += seconds
+                total[1] += 1
+
+            if Metrics.trace is not None:
+                Metrics.trace.write(json.dumps({"ts": time.time(), "stage": name, "seconds": round(seconds, 6), **labels}) + "\n")
+
+    def count(name, value=1):
+        if not Metrics.enabled:
+            return
+        with Metrics.lock:
+            Metrics.counters[name] = Metrics.counters.get(name, 0) + value
+
+    # Copy of the totals, to diff against later (see Metrics.since)
+    def snapshot():
+        with Metrics.lock:
+            return (
+                {name: list(total) for name, total in Metrics.totals.items()},
+                {host: list(total) for host, total in Metrics.hosts.items()},
+                dict(Metrics.counters),
+            )
+
+    # What happened since `snapshot`: stage seconds and calls, counters, and the slowest hosts
+    def since(snapshot, slowest=5):
+        totals, hosts, counters = snapshot
+        now_totals, now_hosts, now_counters = Metrics.snapshot()
+
+        stages = {}
+        for name, (seconds, calls) in now_totals.items():
+            before = totals.get(name, [0.0, 0])
+            if calls > before[1]:
+                stages[name] = {"seconds": round(seconds - before[0], 4), "calls": calls - before[1]}
+
+        latency = []
+        for host, (seconds, requests) in now_hosts.items():
+            before = hosts.get(host, [0.0, 0])
+            if requests > before[1]:
+                latency.append((host, (seconds - before[0]) / (requests - before[1])))
+        latency.sort(key=lambda pair: pair[1], reverse=True)
+
+        return {
+            "stages": stages,
+            "counters": {name: value - counters.get(name, 0) for name, value in now_counters.items() if value != counters.get(name, 0)},
+            "slowest_hosts": [{"host": host, "avg_fetch": round(seconds, 4)} for host, seconds in latency[:slowest]],
+        }
+
+    # Print (and trace) where the wall-clock time of one district went
+    def district_report(url, snapshot, elapsed):
+        report = Metrics.since(snapshot)
+        if Metrics.trace is not None:
+            with Metrics.lock:
+                Metrics.trace.write(json.dumps({"ts": time.time(), "district": url, "seconds": round(elapsed, 4), **report}) + "\n")
+                Metrics.trace.flush()
+
+        print(f"{colors.OKCYAN}{url}: {elapsed:.2f}s{colors.ENDC}")
+        for name, stage in sorted(report["stages"].items(), key=lambda pair: pair[1]["seconds"], reverse=True):
+            print(f"{colors.OKCYAN}  {name:<18} {stage['seconds']:8.3f}s {stage['calls']:>6} calls{colors.ENDC}")
+        for host in report["slowest_hosts"]:
+            print(f"{colors.OKCYAN}  slow host {host['host']}: {host['avg_fetch']:.3f}s per fetch{colors.ENDC}")
+
+    # Prometheus text exposition format
+    def prometheus():
+        totals, hosts, counters = Metrics.snapshot()
+        lines = [
+            "# TYPE scrapper_stage_seconds_total counter",
+            *(f'scrapper_stage_seconds_total{{stage="{name}"}} {seconds}' for name, (seconds, calls) in totals.items()),
+            "# TYPE scrapper_stage_calls_total counter",
+            *(f'scrapper_stage_calls_total{{stage="{name}"}} {calls}' for name, (seconds, calls) in totals.items()),
+            "# TYPE scrapper_host_fetch_seconds_total counter",
+            *(f'scrapper_host_fetch_seconds_total{{host="{host}"}} {seconds}' for host, (seconds, requests) in hosts.items()),
+            "# TYPE scrapper_host_requests_total counter",
+            *(f'scrapper_host_requests_total{{host="{host}"}} {requests}' for host, (seconds, requests) in hosts.items()),
+            "# TYPE scrapper_events_total counter",
+            *(f'scrapper_events_total{{event="{name}"}} {value}' for name, value in counters.items()),
+        ]
+        return "\n".join(lines) + "\n"
+
+    def serve(port):
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = Metrics.prometheus().encode()
+                self.send_response(200 if self.path == "/metrics" else 404)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        Metrics.server = http.server.ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+        threading.Thread(target=Metrics.server.serve_forever, daemon=True).start()
+
+    def close():
+        if Metrics.trace is not None:
+            Metrics.trace.close()
+            Metrics.trace = None
+        if Metrics.server is not None:
+            Metrics.server.shutdown()
+            Metrics.server = None
+
+
 ## General Util Class
 class Utility:
     headers = {'User-Agent': 'Mozilla/5.0'}
+    # BeautifulSoup backend, lxml is several times faster than the pure python html.parser
+    parser = "lxml" if importlib.util.find_spec("lxml") else "html.parser"
+    # Parse modes, the tags each kind of caller needs. Everything else is skipped while parsing
+    parse_modes = {
+        "full": None,
+        "links": SoupStrainer("a", href=True), # find_subwebsites, find_directories
+        "staff": SoupStrainer(["iframe", "table"]), # find_staff
+        "tables": SoupStrainer("table"), # iframe pages
+    }
+    df = None # the Excel sheet, see Utility.get_df
+    urls = None # all urls in the sheet, see Utility.get_urls
+    url_rows = None # sheet row of every url in Utility.urls
+    driver_pool = None # shared DriverPool, see Utility.get_driver_pool
+    http_cache = None # shared ResponseCache, set by Scrapper when caching is enabled
+    host_health = None # shared HostHealth, set by the Fetcher
+    retry_policy = None # RetryPolicy of Utility.get
+    proxy_pool = None # shared ProxyPool, set by the Fetcher when proxies are enabled
+    district_index = None # shared DistrictIndex, see Utility.get_district_index
 
 
     # Get proxies from proxies.txt
-    # Proxies should be in `http: proxy:port https: proxy:port` format
-    def get_proxies():
+    # Proxies should be in `http: proxy:port https: proxy:port` format, a bare `proxy:port` (or url)
+    # is used for both. Blank lines, # comments and malformed entries are skipped
+    def get_proxies(path="proxies.txt"):
         proxies = []
-        with open("proxies.txt", "r") as f:
-            for line in f.read().split("\n"):
-                http = line.split("http")[1].split("https")[0].replace(": ", "").replace(" ", "")
-                https = line.split("https")[1].replace(": ", "").replace(" ", "")
-                proxy = {"http": f"http://{http}", "https": f"http://{https}"}
+        try:
+            with open(path, "r") as f:
+                lines = f.read().split("\n")
+        except OSError:
+            return proxies
+
+        for line in lines:
+            line = line.split("#")[0].strip()
+            if not line:
+                continue
+
+            found = {}
+            for scheme, address in re.findall(r"(https?)\s*:\s+(\S+)", line):
+                found[scheme] = address
+            if not found and " " not in line:
+                found = {"http": line, "https": line}
+            if "https" not in found and "http" in found:
+                found["https"] = found["http"]
+            if "http" not in found and "https" in found:
+                found["http"] = found["https"]
+
+            proxy = {}
+            for scheme, address in found.items():
+                address = address if "://" in address else f"http://{address}"
+                parts = urlparse(address)
+                try:
+                    valid = parts.hostname is not None and parts.port is not None
+                except ValueError: # port out of range or not a number
+                    valid = False
+                if valid:
+                    proxy[scheme] = address
+            if len(proxy) == 2:
                 proxies.append(proxy)
+            else:
+                print(f"{colors.WARNING}skipping malformed proxy: {line}{colors.ENDC}")
 
         return proxies
 
+    # Load the Excel file, once
+    def get_df():
+        if Utility.df is None:
+            Utility.df = pd.read_excel(file_path)
+        return Utility.df
+
+    # Get all urls in the file
+    # Positions in this list (from 1) are the district ids, Utility.get_url_row maps them back to their sheet row
+    def get_urls():
+        if Utility.urls is None:
+            urls = []
+            rows = []
+            for web_number in ["website_1", "website_2", "website_3", "website_4", "website_5"]:
+                for row, url in enumerate(Utility.get_df()[web_number].tolist()):
+                    if not pd.isna(url):
+                        urls.append(url)
+                        rows.append(row)
+            Utility.urls = urls
+            Utility.url_rows = rows
+
+        return Utility.urls
+
+    # Sheet row of the url at position `id` of Utility.get_urls, starting from 1
+    def get_url_row(id):
+        Utility.get_urls()
+        return Utility.url_rows[id - 1]
+
     def get_from_excel(field):
-        return df[field].dropna().tolist()
+        return Utility.get_df()[field].dropna().tolist()
+
+    # Load the spaCy model, downloading it the first time
+    def get_nlp(model="en_core_web_md"):
+        import spacy
+
+        try:
+            return spacy.load(model)
+        except OSError:
+            from spacy.cli import download
+
+            print('Downloading language model for the spaCy POS tagger\n'
+                "(don't worry, this will only happen once)")
+            download(model)
+            return spacy.load(model)
+
+    # Get settings from config.json
+    # Everything except `cache` is optional, missing keys fall back to class defaults
+    def get_config():
+        try:
+            with open("config.json", "r") as f:
+                return json.loads(f.read())
+        except (OSError, ValueError):
+            return {}
+
+    # requests.get with the retries, adaptive timeouts and circuit breaker of the Fetcher
+    # (see RetryPolicy and HostHealth)
+    def get(url, headers=None, timeout=None):
+        if Utility.host_health is None:
+            Utility.host_health = HostHealth()
+        if Utility.retry_policy is None:
+            Utility.retry_policy = RetryPolicy()
+        health, retry = Utility.host_health, Utility.retry_policy
+        host = urlparse(url).netloc
+
+        first = monotonic()
+        attempt = 0
+        while True:
+            with health.attempt(host):
+                start = monotonic()
+                wait = retry.delay(attempt)
+                pool = Utility.proxy_pool
+                entry = pool.acquire(host) if pool is not None else None
+                try:
+                    r = requests.get(
+                        url,
+                        headers=headers or Utility.headers,
+                        timeout=timeout or health.timeout_for(host),
+                        proxies=entry["proxy"] if entry is not None else None,
+                    )
+                except Exception as e:
+                    if pool is not None:
+                        pool.release(entry, ok=False if ProxyPool.proxy_error(e) else None)
+                    health.failure(host)
+                    if not RetryPolicy.retryable(error=e) or not retry.again(attempt, first, wait):
+                        raise
+                else:
+                    if pool is not None:
+                        pool.release(entry, ok=r.status_code != 407, latency=monotonic() - start)
+                    if r.status_code < 500 and r.status_code != 429:
+                        health.success(host, monotonic() - start)
+                    else:
+                        health.failure(host)
+                    if not RetryPolicy.retryable(status=r.status_code) or not retry.again(attempt, first, wait):
+                        return r
+
+            Metrics.count("fetch retries")
+            sleep(wait)
+            attempt += 1
+
+    # Wrapper over Utility.get that goes through Utility.http_cache
+    # Returns the raw body
+    def fetch(url, **kwargs):
+        timeout = kwargs.get("timeout", None)
+        cache = Utility.http_cache
+        if cache is None:
+            return Utility.get(url, timeout=timeout).content
+
+        entry = cache.lookup(url)
+        body = cache.read_fresh(entry)
+        if body is not None:
+            return body
+
+        headers = {**Utility.headers, **cache.conditional_headers(entry)}
+        r = Utility.get(url, headers=headers, timeout=timeout)
+        if r.status_code == 304:
+            body = cache.revalidated(entry)
+            if body is not None:
+                return body
+            r = Utility.get(url, timeout=timeout)
+
+        if r.status_code == 200:
+            cache.store(url, r.content, etag=r.headers.get("ETag"), last_modified=r.headers.get("Last-Modified"))
+        return r.content
+
+    # Wrapper over BeautifulSoup with the configured backend
+    # `mode` limits the tree to the tags needed, see Utility.parse_modes
+    def make_soup(html, mode="full"):
+        with Metrics.stage("parse"):
+            return BeautifulSoup(html, Utility.parser, parse_only=Utility.parse_modes[mode])
 
     # Wrapper over requests and BeautifulSoup
     def get_soup(url, **kwargs):
-        timeout = kwargs.get("timeout", 15)
-
-        r = requests.get(url, headers=Utility.headers, timeout=timeout)
-        return BeautifulSoup(r.content, "html.parser")
+        mode = kwargs.pop("mode", "full")
+        return Utility.make_soup(Utility.fetch(url, **kwargs), mode)
 
     # Raw selenium.get wrapper
-    def get_selenium_raw(self):
+    # Starts a new headless Chrome, prefer leasing one from Utility.get_driver_pool()
+    # `proxy` is a proxy url for every request of the driver
+    # `lean` is the render profile for table extraction (see DriverPool.lean_arguments): eager page loads,
+    # no images, fonts, media or extensions, and the `blocked` url patterns (resource types, trackers)
+    # are blocked through CDP. `page_load_timeout` caps driver.get, in seconds
+    def get_selenium_raw(proxy=None, lean=False, blocked=(), page_load_timeout=None):
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+
         options = Options()
         options.add_argument("user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_14_2) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/75.0.3770.100 Safari/537.36")
         options.add_argument('headless')
         options.add_argument('--disable-gpu')
+        if proxy is not None:
+            options.add_argument(f'--proxy-server={proxy}')
+        if lean:
+            options.page_load_strategy = "eager" # driver.get returns at DOMContentLoaded
+            for argument in DriverPool.lean_arguments:
+                options.add_argument(argument)
+            options.add_experimental_option("prefs", DriverPool.lean_prefs)
 
         driver = webdriver.Chrome(options=options)
+        if page_load_timeout:
+            driver.set_page_load_timeout(page_load_timeout)
+        if lean and blocked:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": list(blocked)})
         return driver
 
+    # Shared pool of headless drivers, created on first use
+    def get_driver_pool():
+        if Utility.driver_pool is None:
+            Utility.driver_pool = DriverPool()
+        return Utility.driver_pool
+
+    # Shared district metadata, created on first use
+    def get_district_index():
+        if Utility.district_index is None:
+            Utility.district_index = DistrictIndex()
+        return Utility.district_index
+
     # Wrapper over selenium.get
     # Returns html
     def get_selenium(url):
-        print(f"{colors.OKBLUE}get_selenium: doc: {url} {colors.ENDC}")
-        options = Options()
-        options.add_argument("user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_14_2) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/75.0.3770.100 Safari/537.36")
-        options.add_argument('headless')
-        options.add_argument('--disable-gpu')
-
-        driver = webdriver.Chrome(options=options)
-        driver.get(url)
-        sleep(5)
-        html = driver.execute_script("return document.getElementsByTagName('html')[0].innerHTML").encode('utf-8').strip()
-        driver.close()
+        cache = Utility.http_cache
+        if cache is not None:
+            html = cache.read_fresh(cache.lookup(url, kind="render"))
+            if html is not None:
+                return html
 
+        print(f"{colors.OKBLUE}get_selenium: doc: {url} {colors.ENDC}")
+        pool = Utility.get_driver_pool()
+
+        with pool.lease() as driver:
+            start = monotonic()
+            pool.load(driver, url)
+            pool.wait_ready(driver)
+            html, transferred, resources = driver.execute_script(DriverPool.snapshot_script)
+            html = html.encode('utf-8').strip()
+
+            # wall time and bytes of every render, see the trace for the per-render numbers
+            if Metrics.enabled:
+                Metrics.record("browser render", monotonic() - start, host=urlparse(url).netloc, bytes=transferred, resources=resources)
+                Metrics.count("render bytes", transferred)
+                Metrics.count("render resources", resources)
+
+        if cache is not None:
+            cache.store(url, html, kind="render")
         return html
     
     # Replaces a term into a relevant set parameter
@@ -111,6 +501,10 @@ class Utility:
 
         if "title" in lowkey:
             key = "Honorific"
+        elif "mail" in lowkey:
+            key = "Email Address"
+        elif "phone" in lowkey:
+            key = "Phone"
         
         bundle.append(key)
         bundle.append(value)
@@ -156,21 +550,19 @@ class Utility:
     # Mainly for optimization
     def clean(lists):
         new_lists = []
-        occuring = []
+        occuring = set()
         for list_ in lists:
             new_list = []
             for elem in list_:
                 if elem in occuring:
                     continue
                 else:
-                    occuring.append(elem)
+                    occuring.add(elem)
                     new_list.append(elem)
 
-            new_lists.append(new_list)
+            if new_list:
+                new_lists.append(new_list)
 
-        for list_ in new_lists:
-            if list_ == []:
-                new_lists.pop(new_lists.index(list_))
         return new_lists
     
     # Remove slash from the end and start, if there is one
@@ -183,43 +575,1679 @@ class Utility:
 
         return url
 
+    # Normalize a url, so that trivially different spellings of it compare equal
+    # Lowercases scheme and host, drops default ports, fragments and trailing slashes, sorts the query
+    def normalize_url(url):
+        parts = urlparse(url.strip())
+        scheme = parts.scheme.lower()
+        host = parts.netloc.lower()
+        if (scheme == "http" and host.endswith(":80")) or (scheme == "https" and host.endswith(":443")):
+            host = host.rsplit(":", 1)[0]
+
+        path = parts.path
+        if len(path) > 1 and path.endswith("/"):
+            path = path[:-1]
+        query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+
+        return urlunparse((scheme, host, path or "/", parts.params, query, ""))
+
+
+## On-disk HTTP Cache
+## Bodies are stored content-addressed under `<path>/objects`, keyed by their sha256,
+## and an sqlite index maps each normalized url to its body and validators
+class ResponseCache:
+    path = "cache"
+    ttl = 7 * 24 * 3600 # seconds a fetched page is served without revalidating
+    render_ttl = 7 * 24 * 3600 # same for rendered (Selenium) html, which cant be revalidated
+    max_bytes = 1024 ** 3 # size bound, least recently used entries are evicted past it
+
+    def __init__(self, **kwargs):
+        self.path = kwargs.get("cache_path", ResponseCache.path)
+        self.ttl = kwargs.get("cache_ttl", ResponseCache.ttl)
+        self.render_ttl = kwargs.get("cache_render_ttl", ResponseCache.render_ttl)
+        self.max_bytes = kwargs.get("cache_max_bytes", ResponseCache.max_bytes)
+
+        os.makedirs(os.path.join(self.path, "objects"), exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(self.path, "index.db"), timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY, url TEXT, kind TEXT, digest TEXT, size INTEGER,
+            etag TEXT, last_modified TEXT, fetched_at REAL, used_at REAL)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_used_at ON entries (used_at)")
+        self.db.commit()
+        # bytes in the cache, kept up to date by store and evict instead of summing the index every time
+        self.total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+        self.hits = 0 # served from disk without touching the network
+        self.revalidations = 0 # served from disk after a 304
+        self.misses = 0 # fetched from the network
+
+    def key(url, kind="get"):
+        return hashlib.sha256(f"{kind} {Utility.normalize_url(url)}".encode()).hexdigest()
+
+    def object_path(self, digest):
+        return os.path.join(self.path, "objects", digest[:2], digest)
+
+    # Cache entry for `url` as a dict, or None
+    # `kind` is "get" for plain fetches and "render" for Selenium html
+    def lookup(self, url, kind="get"):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT key, kind, digest, etag, last_modified, fetched_at FROM entries WHERE key = ?",
+                (ResponseCache.key(url, kind),),
+            ).fetchone()
+        if row is None:
+            return None
+
+        return dict(zip(["key", "kind", "digest", "etag", "last_modified", "fetched_at"], row))
+
+    def read(self, entry):
+        try:
+            with open(self.object_path(entry["digest"]), "rb") as f:
+                body = f.read()
+        except OSError:
+            return None
+
+        with self.lock:
+            self.db.execute("UPDATE entries SET used_at = ? WHERE key = ?", (time.time(), entry["key"]))
+            self.db.commit()
+        return body
+
+    # Body of `entry` if it is within its ttl, otherwise None
+    def read_fresh(self, entry):
+        if entry is None:
+            return None
+
+        ttl = self.render_ttl if entry["kind"] == "render" else self.ttl
+        if time.time() - entry["fetched_at"] >= ttl:
+            return None
+
+        body = self.read(entry)
+        if body is not None:
+            with self.lock:
+                self.hits += 1
+        return body
+
+    # If-None-Match / If-Modified-Since headers for revalidating a stale `entry`
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry is None:
+            return headers
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        return headers
+
+    # The server answered 304 for `entry`, renew it and return its body
+    # Returns None if the body is gone, in which case the caller should refetch
+    def revalidated(self, entry):
+        body = self.read(entry) if entry is not None else None
+        if body is None:
+            return None
+
+        with self.lock:
+            self.db.execute("UPDATE entries SET fetched_at = ? WHERE key = ?", (time.time(), entry["key"]))
+            self.db.commit()
+            self.revalidations += 1
+        return body
+
+    # Store a body that had to be fetched from the network (counted as a miss)
+    def store(self, url, body, kind="get", etag=None, last_modified=None):
+        digest = hashlib.sha256(body).hexdigest()
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp, "wb") as f:
+                f.write(body)
+            os.replace(temp, path)
+
+        now = time.time()
+        key = ResponseCache.key(url, kind)
+        with self.lock:
+            self.misses += 1
+            replaced = self.db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self.db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, url, kind, digest, len(body), etag, last_modified, now, now),
+            )
+            self.db.commit()
+            self.total += len(body) - (replaced[0] if replaced is not None else 0)
+        self.evict()
+
+    # Drop least recently used entries until the cache fits in `max_bytes`
+    def evict(self):
+        with self.lock:
+            if self.total <= self.max_bytes:
+                return
+            # other worker processes store into the same index, count it for real before evicting
+            total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            self.total = total
+            if total <= self.max_bytes:
+                return
+
+            dropped = []
+            for key, digest, size in self.db.execute("SELECT key, digest, size FROM entries ORDER BY used_at").fetchall():
+                if total <= self.max_bytes:
+                    break
+                dropped.append((key, digest))
+                total -= size
+
+            self.db.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, digest in dropped])
+            self.db.commit()
+            self.total = total
+            for key, digest in dropped:
+                # bodies are shared between urls with the same content
+                if self.db.execute("SELECT 1 FROM entries WHERE digest = ? LIMIT 1", (digest,)).fetchone() is None:
+                    try:
+                        os.remove(self.object_path(digest))
+                    except OSError:
+                        pass
+
+    def report(self):
+        return f"cache: {self.hits} hits, {self.revalidations} revalidated, {self.misses} misses"
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+## Crawl Frontier
+## Canonical urls handed out this run, so a page linked from many places is fetched and parsed once
+class CrawlFrontier:
+    # query parameters that never change the page
+    tracking_params = ("utm_", "gclid", "fbclid", "msclkid", "mc_cid", "mc_eid", "_ga", "_hsenc", "_hsmi")
+    capacity = 10_000_000 # urls the bloom filter is sized for
+    error_rate = 0.001 # bloom filter false positive rate
+
+    def __init__(self, **kwargs):
+        # the bloom filter uses a fixed ~18 MB for 10M urls, but may skip a few urls it never saw
+        if kwargs.get("frontier_bloom", False):
+            capacity = kwargs.get("frontier_capacity", CrawlFrontier.capacity)
+            self.seen = BloomFilter(capacity, kwargs.get("frontier_error_rate", CrawlFrontier.error_rate))
+        else:
+            self.seen = set()
+
+        self.saved = 0 # fetches skipped because the url was seen already
+
+    # Canonical form of a url, eg `http://www.School.org/staff/?utm_source=x#top` is `https://school.org/staff`
+    # Scheme, www. and tracking params dont matter, and trailing slashes are removed as in Utility.remove_slash
+    def canonicalize(url):
+        parts = urlparse(Utility.normalize_url(url))
+        host = parts.netloc
+        if host.startswith("www."):
+            host = host[4:]
+
+        query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not k.lower().startswith(CrawlFrontier.tracking_params)]
+        return urlunparse(("https", host, parts.path, parts.params, urlencode(query), ""))
+
+    # Add a url, returns whether it is new this run
+    def add(self, url):
+        key = CrawlFrontier.canonicalize(url)
+        if key in self.seen:
+            self.saved += 1
+            return False
+
+        self.seen.add(key)
+        return True
+
+    # The urls that are new this run, in order
+    def filter(self, urls):
+        return [url for url in urls if self.add(url)]
+
+    def report(self):
+        return f"frontier: {len(self.seen)} urls, {self.saved} duplicate fetches saved"
+
+
+## Bloom Filter
+## Fixed-size probabilistic set, no false negatives but `error_rate` false positives
+class BloomFilter:
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2)) # bits
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    # Bit positions of `item`, by double hashing one blake2b digest
+    def positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for pos in self.positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self.positions(item))
+
+    # Approximate, counts adds
+    def __len__(self):
+        return self.count
+
+
+## Politeness Scheduler
+## Sits between the scrapper and the network: every request waits for a token from its host's
+## bucket and from its provider's (the resolved IP, shared by every site on that hosting).
+## Host rates honor robots.txt crawl-delay and Retry-After, grow while the host answers fast,
+## and are halved on 429s, 5xxs and timeouts
+class TokenBucket:
+
+    def __init__(self, rate, burst):
+        self.rate = rate # tokens per second
+        self.burst = burst
+        self.tokens = burst
+        self.updated = monotonic()
+
+    # Take a token, returns the seconds to wait before using it
+    # Tokens can go negative, so concurrent callers queue up instead of racing
+    def reserve(self):
+        now = monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+
+        return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class Scheduler:
+    host_rate = 2.0 # starting requests per second per host
+    min_rate = 0.05
+    max_rate = 10.0
+    provider_rate = 8.0 # requests per second per resolved IP
+    target_latency = 2.0 # hosts answering faster than this get sped up
+    max_retry_after = 300 # cap on how long a Retry-After can block a host
+    robots = True # honor robots.txt crawl-delay
+
+    def __init__(self, session, **kwargs):
+        self.session = session
+        self.enabled = kwargs.get("politeness", True)
+        self.host_rate = kwargs.get("host_rate", Scheduler.host_rate)
+        self.max_rate = kwargs.get("host_max_rate", Scheduler.max_rate)
+        self.provider_rate = kwargs.get("provider_rate", Scheduler.provider_rate)
+        self.target_latency = kwargs.get("target_latency", Scheduler.target_latency)
+        self.robots = kwargs.get("robots", Scheduler.robots)
+        self.burst = kwargs.get("max_per_host", Fetcher.max_per_host)
+
+        # only touched from the fetcher loop, so no locks
+        self.hosts = {} # host -> Task resolving to its state dict
+        self.providers = {} # ip -> TokenBucket
+
+    # Wait until `url` may be requested
+    async def acquire(self, url):
+        if not self.enabled:
+            return
+        parts = urlparse(url)
+        if parts.netloc not in self.hosts:
+            self.hosts[parts.netloc] = asyncio.ensure_future(self.open_host(parts))
+        host = await self.hosts[parts.netloc]
+
+        wait = host["blocked_until"] - monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        wait = max(host["bucket"].reserve(), host["provider"].reserve())
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    # State of a host seen for the first time: its buckets, and its crawl-delay from robots.txt
+    async def open_host(self, parts):
+        max_rate = self.max_rate
+        if self.robots:
+            delay = await self.crawl_delay(parts)
+            if delay:
+                max_rate = min(max_rate, 1 / delay)
+
+        ip = await self.resolve(parts.hostname)
+        if ip not in self.providers:
+            self.providers[ip] = TokenBucket(self.provider_rate, self.burst * 2)
+
+        rate = min(self.host_rate, max_rate)
+        return {
+            "bucket": TokenBucket(rate, self.burst if max_rate == self.max_rate else 1),
+            "provider": self.providers[ip],
+            "max_rate": max_rate,
+            "blocked_until": 0,
+            "latency": None, # moving average, seconds
+            "errors": 0,
+        }
+
+    async def crawl_delay(self, parts):
+        robots = urllib.robotparser.RobotFileParser()
+        try:
+            async with self.session.get(f"{parts.scheme}://{parts.netloc}/robots.txt", timeout=aiohttp.ClientTimeout(total=5)) as r:
+                if r.status != 200:
+                    return None
+                robots.parse((await r.text(errors="ignore")).splitlines())
+        except Exception:
+            return None
+
+        delay = robots.crawl_delay(Utility.headers["User-Agent"])
+        rate = robots.request_rate(Utility.headers["User-Agent"])
+        if rate is not None and rate.requests:
+            delay = max(delay or 0, rate.seconds / rate.requests)
+        return float(delay) if delay else None
+
+    # Resolved IP of a host, the host itself if it doesnt resolve
+    async def resolve(self, hostname):
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(hostname, None)
+            return infos[0][4][0]
+        except Exception:
+            return hostname
+
+    # Adapt the rate of the host behind `url` to how its last request went
+    # `status` is None if the request failed without an answer (timeout, connection error)
+    def record(self, url, status, latency, retry_after=None):
+        task = self.hosts.get(urlparse(url).netloc)
+        if not self.enabled or task is None or not task.done():
+            return
+        host = task.result()
+        bucket = host["bucket"]
+
+        if status == 429 or status == 503 or status is None or status >= 500:
+            bucket.rate = max(Scheduler.min_rate, bucket.rate / 2)
+            host["errors"] += 1
+            wait = Scheduler.retry_after(retry_after)
+            if wait:
+                host["blocked_until"] = max(host["blocked_until"], monotonic() + min(wait, Scheduler.max_retry_after))
+            return
 
-## Table Utilities
-## For table manipulation
-class TableUtil:
+        host["errors"] = 0
+        average = host["latency"]
+        host["latency"] = latency if average is None else 0.8 * average + 0.2 * latency
+        if host["latency"] < self.target_latency:
+            bucket.rate = min(host["max_rate"], bucket.rate + 0.25)
+        elif host["latency"] > 2 * self.target_latency:
+            bucket.rate = max(Scheduler.min_rate, bucket.rate * 0.75)
+
+    # Seconds to wait from a Retry-After header, which is either seconds or an HTTP date
+    def retry_after(value):
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+## Retries, Timeouts and Circuit Breaking
+## Transient failures (timeouts, dropped connections, 429s and 5xxs) are retried with exponential
+## backoff and full jitter. Every host gets a timeout from its own observed latency, and a host that
+## keeps failing is fast-failed for a while instead of costing a full timeout on every link to it
+class CircuitOpenError(Exception):
+    pass
+
+
+class RetryPolicy:
+    retries = 3 # attempts after the first one
+    backoff = 0.5 # seconds, doubled every attempt
+    max_backoff = 10.0
+    budget = 10.0 # seconds from the first attempt after which a request isnt retried anymore
+    statuses = (408, 425, 429, 500, 502, 503, 504) # answers worth another try
+
+    def __init__(self, **kwargs):
+        self.retries = kwargs.get("retries", RetryPolicy.retries)
+        self.backoff = kwargs.get("retry_backoff", RetryPolicy.backoff)
+        self.max_backoff = kwargs.get("retry_max_backoff", RetryPolicy.max_backoff)
+        self.budget = kwargs.get("retry_budget", RetryPolicy.budget)
+
+    # Seconds to wait before retry number `attempt` (from 0), full jitter
+    def delay(self, attempt):
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    # Should a request that started at `start` be tried again after waiting `wait` seconds?
+    def again(self, attempt, start, wait):
+        return attempt < self.retries and monotonic() + wait - start < self.budget
+
+    # Is a failed attempt worth retrying? Only GETs are sent, so any transient failure is
+    def retryable(status=None, error=None):
+        if error is not None:
+            return isinstance(error, (
+                asyncio.TimeoutError,
+                aiohttp.ClientConnectionError,
+                aiohttp.ClientPayloadError,
+                requests.ConnectionError,
+                requests.Timeout,
+            ))
+        return status in RetryPolicy.statuses
+
+
+class HostHealth:
+    min_timeout = 3.0 # adaptive timeouts never go below this
+    failures = 5 # consecutive failures that open a host's circuit
+    cooldown = 60.0 # seconds an open circuit fast-fails before a trial request
+
+    def __init__(self, **kwargs):
+        self.timeout = kwargs.get("timeout", Fetcher.timeout) # for hosts without history, and the cap
+        self.min_timeout = kwargs.get("min_timeout", HostHealth.min_timeout)
+        self.failures = kwargs.get("breaker_failures", HostHealth.failures)
+        self.cooldown = kwargs.get("breaker_cooldown", HostHealth.cooldown)
+        self.hosts = {} # host -> {"srtt", "rttvar", "failures", "opened_at", "trial"}
+        self.lock = threading.RLock() # shared by the fetcher loop thread and Utility.get callers
+
+    def state(self, host):
+        if host not in self.hosts:
+            self.hosts[host] = {"srtt": None, "rttvar": None, "failures": 0, "opened_at": None, "trial": False}
+        return self.hosts[host]
+
+    # Timeout for the next request to `host`, srtt + 4 * rttvar like TCP's, within [min_timeout, timeout]
+    # A host that never answered gets the full timeout, halved for every failure in a row
+    def timeout_for(self, host):
+        with self.lock:
+            state = self.state(host)
+            if state["srtt"] is None:
+                return max(self.min_timeout, self.timeout / 2 ** state["failures"])
+            return min(self.timeout, max(self.min_timeout, state["srtt"] + 4 * state["rttvar"]))
+
+    # Raises CircuitOpenError while `host` is fast-failed
+    # Once the cooldown is over a single trial request is let through, its outcome closes or reopens the circuit
+    # Returns whether this request is the trial
+    def allow(self, host):
+        with self.lock:
+            state = self.state(host)
+            if state["opened_at"] is None:
+                return False
+            if monotonic() - state["opened_at"] < self.cooldown or state["trial"]:
+                Metrics.count("circuit fast fails")
+                raise CircuitOpenError(f"circuit open for {host}, {state['failures']} failures in a row")
+            state["trial"] = True
+            return True
+
+    # One request to `host`, through self.allow
+    # A trial that ends without a success or failure (cancelled, proxy error) lets the next request be the trial,
+    # instead of fast-failing the host for the rest of the run
+    @contextmanager
+    def attempt(self, host):
+        trial = self.allow(host)
+        try:
+            yield
+        finally:
+            if trial:
+                with self.lock:
+                    self.state(host)["trial"] = False
+
+    def success(self, host, latency):
+        with self.lock:
+            state = self.state(host)
+            if state["srtt"] is None:
+                state["srtt"], state["rttvar"] = latency, latency / 2
+            else:
+                state["rttvar"] = 0.75 * state["rttvar"] + 0.25 * abs(state["srtt"] - latency)
+                state["srtt"] = 0.875 * state["srtt"] + 0.125 * latency
+            state["failures"] = 0
+            state["opened_at"] = None
+            state["trial"] = False
+
+    def failure(self, host):
+        with self.lock:
+            state = self.state(host)
+            state["failures"] += 1
+            if state["trial"] or state["failures"] >= self.failures:
+                if state["opened_at"] is None or state["trial"]:
+                    Metrics.count("circuits opened")
+                state["opened_at"] = monotonic()
+                state["trial"] = False
+
+    def report(self):
+        with self.lock:
+            opened = sum(1 for state in self.hosts.values() if state["opened_at"] is not None)
+        return f"hosts: {len(self.hosts)} seen, {opened} circuits open"
+
+
+## Proxy Pool
+## Spreads requests over the proxies of proxies.txt (`proxies` setting), so they dont all leave from one IP.
+## Proxies are picked weighted by their observed latency, each carries at most `proxy_concurrency`
+## requests at once, and one that keeps failing is evicted until a background health check finds it
+## working again. With `proxy_sticky` every host keeps going through the same proxy
+class ProxyPool:
+    concurrency = 4 # requests in flight per proxy
+    failures = 3 # consecutive proxy failures that evict it
+    check_interval = 60 # seconds between health checks
+    check_url = "http://example.com/"
+    default_latency = 1.0 # seconds, for proxies without measurements yet
+
+    # `proxy_list` overrides proxies.txt, in the Utility.get_proxies format
+    def __init__(self, proxy_list=None, **kwargs):
+        self.concurrency = kwargs.get("proxy_concurrency", ProxyPool.concurrency)
+        self.failures = kwargs.get("proxy_failures", ProxyPool.failures)
+        self.check_interval = kwargs.get("proxy_check_interval", ProxyPool.check_interval)
+        self.check_url = kwargs.get("proxy_check_url", ProxyPool.check_url)
+        self.sticky = kwargs.get("proxy_sticky", False)
+        proxies = proxy_list
+        if proxies is None:
+            proxies = Utility.get_proxies(kwargs.get("proxies_path", "proxies.txt"))
+
+        # proxy dicts (the requests format) with their state
+        self.entries = [
+            {"proxy": proxy, "latency": None, "active": 0, "failures": 0, "healthy": True, "requests": 0}
+            for proxy in proxies
+        ]
+        self.hosts = {} # host -> entry, with proxy_sticky
+        self.lock = threading.Lock()
+        self.freed = threading.Condition(self.lock)
+        self.waiters = [] # (loop, asyncio.Event) of acquire_async calls waiting for a free proxy
+
+        self.stopped = threading.Event()
+        self.checker = threading.Thread(target=self.check_loop, daemon=True)
+        self.checker.start()
+
+    # Pick a proxy for `host` and count a request on it, None if every healthy proxy is at its cap
+    # or there are no healthy proxies at all (then `wait` tells whether waiting would help)
+    def choose(self, host):
+        entry = self.hosts.get(host) if self.sticky else None
+        if entry is not None and entry["healthy"] and entry["active"] < self.concurrency:
+            return entry
+
+        healthy = [entry for entry in self.entries if entry["healthy"]]
+        free = [entry for entry in healthy if entry["active"] < self.concurrency]
+        if not free:
+            return None
+
+        known = [entry["latency"] for entry in free if entry["latency"] is not None]
+        default = sum(known) / len(known) if known else ProxyPool.default_latency
+        weights = [1 / max(entry["latency"] or default, 0.001) for entry in free]
+        entry = random.choices(free, weights)[0]
+        if self.sticky:
+            self.hosts[host] = entry
+        return entry
+
+    def healthy(self):
+        return any(entry["healthy"] for entry in self.entries)
+
+    # Lease a proxy for a request to `host`, blocking while every healthy proxy is at its cap
+    # Returns the entry (its "proxy" is a requests style dict), None to go direct when no proxy is healthy
+    def acquire(self, host, timeout=None):
+        with self.freed:
+            while True:
+                if not self.healthy():
+                    Metrics.count("proxy direct")
+                    return None
+                entry = self.choose(host)
+                if entry is not None:
+                    entry["active"] += 1
+                    entry["requests"] += 1
+                    return entry
+                if not self.freed.wait(timeout):
+                    return None
+
+    # Same, for the fetcher loop, waits on an asyncio.Event so neither the loop nor its executor is blocked
+    # A lease is only taken once the proxy is handed out, a cancelled wait holds nothing
+    async def acquire_async(self, host):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self.lock:
+                if not self.healthy():
+                    Metrics.count("proxy direct")
+                    return None
+                entry = self.choose(host)
+                if entry is not None:
+                    entry["active"] += 1
+                    entry["requests"] += 1
+                    return entry
+                waiter = (loop, asyncio.Event())
+                self.waiters.append(waiter)
 
-    # Clean the table
-    # Used by Utility.parse_table. You dont gotta do it yourself
-    def clean_table(table):
-        new_table = {}
-        for name, parameters in table.items():
-            new_params = {}
-            # remove parameters with np.int64 as the key value
-            for param,value in parameters.items():
-                if isinstance(param, np.int64):
-                    continue
+            try:
+                await waiter[1].wait()
+            finally:
+                with self.lock:
+                    self.waiters.remove(waiter)
+
+    # Wake up every acquire and acquire_async waiting for a proxy, called with `self.freed` held
+    def notify(self):
+        self.freed.notify_all()
+        for loop, event in self.waiters:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(event.set)
+
+    # Give a leased proxy back
+    # `ok` is True if the proxy worked, False if the proxy itself failed, None if the request failed
+    # for some other reason (the target host timed out, ...)
+    def release(self, entry, ok=True, latency=None):
+        if entry is None:
+            return
+        with self.freed:
+            entry["active"] -= 1
+            if ok:
+                entry["failures"] = 0
+                if latency is not None:
+                    entry["latency"] = latency if entry["latency"] is None else 0.8 * entry["latency"] + 0.2 * latency
+            elif ok is False:
+                entry["failures"] += 1
+                if entry["healthy"] and entry["failures"] >= self.failures:
+                    entry["healthy"] = False
+                    Metrics.count("proxies evicted")
+            self.notify()
+
+    # Was this exception the proxy's fault rather than the target's?
+    def proxy_error(error):
+        return isinstance(error, (aiohttp.ClientProxyConnectionError, aiohttp.ClientHttpProxyError, requests.exceptions.ProxyError))
+
+    # Background health checks, every `check_interval` seconds each proxy fetches `check_url`
+    # An evicted proxy that answers is taken back, a healthy one that doesnt counts a failure
+    def check_loop(self):
+        while not self.stopped.wait(self.check_interval):
+            for entry in list(self.entries):
+                if self.stopped.is_set():
+                    return
+                ok, latency = self.check(entry["proxy"])
+                with self.freed:
+                    if ok:
+                        entry["latency"] = latency if entry["latency"] is None else 0.8 * entry["latency"] + 0.2 * latency
+                        entry["failures"] = 0
+                        if not entry["healthy"]:
+                            entry["healthy"] = True
+                            Metrics.count("proxies restored")
+                    else:
+                        entry["failures"] += 1
+                        if entry["healthy"] and entry["failures"] >= self.failures:
+                            entry["healthy"] = False
+                            Metrics.count("proxies evicted")
+                    self.notify()
+
+    def check(self, proxy):
+        start = monotonic()
+        try:
+            r = requests.get(self.check_url, headers=Utility.headers, proxies=proxy, timeout=10)
+            return r.status_code < 500, monotonic() - start
+        except Exception:
+            return False, None
+
+    def report(self):
+        healthy = sum(1 for entry in self.entries if entry["healthy"])
+        spread = ", ".join(str(entry["requests"]) for entry in self.entries)
+        return f"proxies: {healthy}/{len(self.entries)} healthy, requests per proxy: {spread}"
+
+    def close(self):
+        self.stopped.set()
+
+
+## Async Fetch Engine
+## Pooled keep-alive HTTP client running on its own event loop thread,
+## so the rest of the (synchronous) scrapper can fetch many pages at once
+class Fetcher:
+    max_connections = 32 # global concurrency limit
+    max_per_host = 4 # per-host concurrency limit
+    timeout = 15
+    keepalive = 30 # seconds an idle connection is kept open
+    window = 16 # pages in flight in iter_pages
+    cache_threads = 4 # threads doing Utility.http_cache I/O for the loop
+
+    def __init__(self, **kwargs):
+        self.max_connections = kwargs.get("max_connections", Fetcher.max_connections)
+        self.max_per_host = kwargs.get("max_per_host", Fetcher.max_per_host)
+        self.timeout = kwargs.get("timeout", Fetcher.timeout)
+        self.keepalive = kwargs.get("keepalive", Fetcher.keepalive)
+        self.window = kwargs.get("fetch_window", Fetcher.window)
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.cache_io = ThreadPoolExecutor(kwargs.get("cache_threads", Fetcher.cache_threads), thread_name_prefix="cache")
+        self.session = self.run(self.open_session())
+        self.scheduler = Scheduler(self.session, **kwargs)
+        self.retry = Utility.retry_policy = RetryPolicy(**kwargs)
+        self.health = Utility.host_health = HostHealth(**kwargs)
+        self.proxies = None
+        if kwargs.get("proxies", False):
+            self.proxies = Utility.proxy_pool = ProxyPool(**kwargs)
+
+    async def open_session(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections,
+            limit_per_host=self.max_per_host,
+            keepalive_timeout=self.keepalive,
+            ttl_dns_cache=300,
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            headers=Utility.headers,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+
+    # Run a coroutine on the fetcher loop and wait for its result
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    # One GET through the politeness scheduler, retried on transient failures (see RetryPolicy)
+    # with a per-host adaptive timeout, raises CircuitOpenError if the host is being fast-failed
+    # Returns (status, headers, body)
+    async def request(self, url, headers=None):
+        host = urlparse(url).netloc
+        first = monotonic()
+        attempt = 0
+        while True:
+            with self.health.attempt(host):
+                await self.scheduler.acquire(url)
+
+                entry = await self.proxies.acquire_async(host) if self.proxies is not None else None
+                proxy = entry["proxy"][urlparse(url).scheme] if entry is not None else None
+
+                start = monotonic()
+                error, ok, took = None, None, None # `ok` and `took` as ProxyPool.release takes them
+                try:
+                    timeout = aiohttp.ClientTimeout(total=self.health.timeout_for(host))
+                    async with self.session.get(url, headers=headers, timeout=timeout, proxy=proxy) as r:
+                        body = await r.read()
+                    ok, took = r.status != 407, monotonic() - start
+                except Exception as e:
+                    error = e
+                    ok = False if ProxyPool.proxy_error(e) else None
+                finally:
+                    # also when the fetch gets cancelled, else the proxy slot is never given back
+                    if self.proxies is not None:
+                        self.proxies.release(entry, ok=ok, latency=took)
+
+                if error is not None:
+                    if self.proxies is not None and ProxyPool.proxy_error(error):
+                        # not the host's fault, another proxy gets a try
+                        Metrics.count("proxy errors")
+                        if attempt < self.retry.retries:
+                            attempt += 1
+                            continue
+                        raise error
+                    self.scheduler.record(url, None, monotonic() - start)
+                    self.health.failure(host)
+                    Metrics.count("fetch errors")
+                    wait = self.retry.delay(attempt)
+                    if not RetryPolicy.retryable(error=error) or not self.retry.again(attempt, first, wait):
+                        raise error
                 else:
-                    new_params[param] = value
+                    self.scheduler.record(url, r.status, took, r.headers.get("Retry-After"))
+                    if Metrics.enabled:
+                        Metrics.record("fetch", took, host=host, status=r.status)
+                    if r.status < 500 and r.status != 429:
+                        self.health.success(host, took)
+                    else:
+                        self.health.failure(host)
+
+                    wait = max(self.retry.delay(attempt), Scheduler.retry_after(r.headers.get("Retry-After")) or 0)
+                    if not RetryPolicy.retryable(status=r.status) or not self.retry.again(attempt, first, wait):
+                        return r.status, r.headers, body
+
+            Metrics.count("fetch retries")
+            attempt += 1
+            await asyncio.sleep(wait)
+
+    # Run a ResponseCache method on the cache threads, its sqlite and disk I/O never stalls the loop
+    async def cache_call(self, method, *args, **kwargs):
+        return await self.loop.run_in_executor(self.cache_io, partial(method, *args, **kwargs))
+
+    # Fetch a single url, returns the raw body
+    # Goes through Utility.http_cache if there is one
+    async def fetch(self, url):
+        cache = Utility.http_cache
+        if cache is None:
+            status, headers, body = await self.request(url)
+            return body
+
+        entry = await self.cache_call(cache.lookup, url)
+        body = await self.cache_call(cache.read_fresh, entry)
+        if body is not None:
+            return body
+
+        status, headers, body = await self.request(url, cache.conditional_headers(entry))
+        if status == 304:
+            body = await self.cache_call(cache.revalidated, entry)
+            if body is not None:
+                return body
+            # the body got evicted meanwhile
+            status, headers, body = await self.request(url)
+
+        if status == 200:
+            await self.cache_call(cache.store, url, body, etag=headers.get("ETag"), last_modified=headers.get("Last-Modified"))
+        return body
+
+    async def fetch_all(self, urls):
+        return await asyncio.gather(*(self.fetch(url) for url in urls), return_exceptions=True)
+
+    # Fetch many urls concurrently
+    # Returns a list in the same order as `urls`, failed fetches are returned as the Exception
+    def get_pages(self, urls):
+        if not urls:
+            return []
+        return self.run(self.fetch_all(urls))
+
+    # Fetch many urls concurrently, with at most `window` fetches in flight
+    # Yields (url, page) in the same order as `urls` as soon as each is done, failed fetches are yielded
+    # as the Exception. Memory stays bounded by the window instead of all the pages.
+    def iter_pages(self, urls, window=None):
+        window = window or self.window
+        pending = deque()
+        try:
+            for url in urls:
+                pending.append((url, asyncio.run_coroutine_threadsafe(self.fetch(url), self.loop)))
+                if len(pending) >= window:
+                    yield Fetcher.result(*pending.popleft())
+            while pending:
+                yield Fetcher.result(*pending.popleft())
+        finally:
+            for url, future in pending: # consumer stopped early
+                future.cancel()
+
+    def result(url, future):
+        try:
+            return url, future.result()
+        except Exception as e:
+            return url, e
+
+    # Drop-in for Utility.get_soup that goes through the pooled session
+    def get_soup(self, url, mode="full"):
+        return Utility.make_soup(self.run(self.fetch(url)), mode)
+
+    def close(self):
+        if self.loop.is_closed():
+            return
+        if self.proxies is not None:
+            self.proxies.close()
+        self.run(self.session.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.cache_io.shutdown()
+
+
+## Headless Chrome Pool
+## Long-lived drivers that are leased out and returned, instead of starting Chrome for every page
+class DriverPool:
+    size = 2 # max number of live drivers
+    max_pages = 50 # recycle a driver after it has rendered this many pages
+    ready_timeout = 10 # max seconds to wait for a page to become ready
+    idle_time = 0.5 # network counts as idle when no resource was loaded for this long
+
+    page_load_timeout = 20 # cap on driver.get, the page is stopped and used as far as it got
+    lean = True # lean render profile, see Utility.get_selenium_raw
+
+    # Chrome switches of the lean profile
+    lean_arguments = [
+        "--disable-extensions",
+        "--disable-background-networking",
+        "--disable-component-update",
+        "--disable-default-apps",
+        "--disable-sync",
+        "--no-first-run",
+        "--mute-audio",
+        "--autoplay-policy=user-gesture-required",
+        "--disable-remote-fonts",
+        "--blink-settings=imagesEnabled=false",
+        "--disk-cache-size=52428800", # drivers are reused, so a site's scripts are cached between renders
+    ]
+    lean_prefs = {
+        "profile.managed_default_content_settings.images": 2,
+        "profile.managed_default_content_settings.media_stream": 2,
+        "profile.default_content_setting_values.notifications": 2,
+        "profile.default_content_setting_values.geolocation": 2,
+    }
+    # url patterns blocked in the lean profile, the DOM of a staff table needs none of these
+    blocked = [
+        pattern
+        for extension in ("png", "jpg", "jpeg", "gif", "webp", "svg", "ico", "bmp", "woff", "woff2", "ttf", "otf", "eot",
+                          "css", "mp4", "webm", "mp3", "m4a", "mov", "avi", "pdf")
+        for pattern in (f"*.{extension}", f"*.{extension}?*")
+    ] + [
+        "*google-analytics.com*", "*googletagmanager.com*", "*googlesyndication.com*", "*googleadservices.com*",
+        "*doubleclick.net*", "*facebook.net*", "*facebook.com/tr*", "*hotjar.com*", "*clarity.ms*", "*addthis.com*",
+        "*sharethis.com*", "*platform.twitter.com*", "*youtube.com/embed*", "*ytimg.com*", "*player.vimeo.com*",
+        "*nr-data.net*", "*newrelic.com*", "*quantserve.com*", "*scorecardresearch.com*", "*recaptcha*",
+    ]
+
+    # One round trip: [readyState, is `selector` in the DOM, number of loaded resources]
+    ready_script = "return [document.readyState, document.querySelector(arguments[0]) !== null, performance.getEntriesByType('resource').length]"
+    # One round trip: [page html, bytes transferred for the page and its resources, number of resources]
+    # Cross-origin resources without Timing-Allow-Origin report 0 bytes, so this is a lower bound
+    snapshot_script = (
+        "var entries = performance.getEntriesByType('navigation').concat(performance.getEntriesByType('resource'));"
+        "return [document.getElementsByTagName('html')[0].innerHTML,"
+        " entries.reduce(function (n, e) { return n + (e.transferSize || 0); }, 0),"
+        " entries.length - 1];"
+    )
+
+    def __init__(self, **kwargs):
+        self.size = kwargs.get("driver_pool_size", DriverPool.size)
+        self.max_pages = kwargs.get("driver_max_pages", DriverPool.max_pages)
+        self.ready_timeout = kwargs.get("ready_timeout", DriverPool.ready_timeout)
+        self.idle_time = kwargs.get("idle_time", DriverPool.idle_time)
+        self.page_load_timeout = kwargs.get("render_timeout", DriverPool.page_load_timeout)
+        self.lean = kwargs.get("lean_render", DriverPool.lean)
+        self.blocked = DriverPool.blocked + kwargs.get("render_blocked", [])
+
+        self.idle = queue.LifoQueue() # (driver, pages rendered) ready to be leased
+        self.slots = threading.BoundedSemaphore(self.size)
+        self.closed = False
+        atexit.register(self.close)
+
+    # Lease a driver, it is returned to the pool afterwards
+    # Drivers that crash or hit `max_pages` are quit and replaced on the next lease
+    @contextmanager
+    def lease(self):
+        from selenium.common.exceptions import WebDriverException
+
+        self.slots.acquire()
+        try:
+            driver = None
+            while driver is None:
+                try:
+                    driver, pages, proxy = self.idle.get_nowait()
+                except queue.Empty:
+                    driver, pages, proxy = self.new_driver()
+                if proxy is not None and not proxy["healthy"]:
+                    self.quit(driver, proxy) # its proxy got evicted
+                    driver = None
+
+            try:
+                yield driver
+            except WebDriverException:
+                self.quit(driver, proxy)
+                raise
+            except Exception:
+                self.release(driver, pages + 1, proxy)
+                raise
+            self.release(driver, pages + 1, proxy)
+        finally:
+            self.slots.release()
+
+    # A driver, going through a proxy of Utility.proxy_pool if there is one
+    # The driver holds one of its proxy's concurrency slots until it is quit
+    # Returns (driver, 0 pages rendered, proxy entry or None)
+    def new_driver(self):
+        pool = Utility.proxy_pool
+        proxy = pool.acquire("browser") if pool is not None else None
+        try:
+            driver = Utility.get_selenium_raw(
+                proxy["proxy"]["http"] if proxy is not None else None,
+                lean=self.lean,
+                blocked=self.blocked,
+                page_load_timeout=self.page_load_timeout,
+            )
+        except Exception:
+            if proxy is not None:
+                pool.release(proxy, ok=None)
+            raise
+        return driver, 0, proxy
+
+    def release(self, driver, pages, proxy=None):
+        if self.closed or pages >= self.max_pages:
+            self.quit(driver, proxy)
+        else:
+            self.idle.put((driver, pages, proxy))
+
+    def quit(self, driver, proxy=None):
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        if proxy is not None and Utility.proxy_pool is not None:
+            Utility.proxy_pool.release(proxy, ok=None)
+
+    # driver.get, a page that hits the page load timeout is stopped where it got instead of failing
+    def load(self, driver, url):
+        from selenium.common.exceptions import TimeoutException
+
+        try:
+            driver.get(url)
+        except TimeoutException:
+            Metrics.count("render timeouts")
+            driver.execute_script("window.stop();")
+
+    # Wait until `selector` is in the DOM, or the page is loaded and the network is idle
+    # Returns whether `selector` was found before `timeout`
+    def wait_ready(self, driver, selector="table", timeout=None):
+        timeout = timeout or self.ready_timeout
+        deadline = monotonic() + timeout
+        resources, changed_at = -1, monotonic()
+
+        while monotonic() < deadline:
+            state, found, count = driver.execute_script(DriverPool.ready_script, selector)
+            if found:
+                return True
+
+            now = monotonic()
+            if count != resources:
+                resources, changed_at = count, now
+            elif state == "complete" and now - changed_at >= self.idle_time:
+                return False
+            sleep(0.1)
+
+        return False
+
+    # Quit every idle driver, leased ones are quit when they are returned
+    def close(self):
+        self.closed = True
+        while True:
+            try:
+                driver, pages, proxy = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            self.quit(driver, proxy)
+
+
+## Staff Record
+## One staff member, slotted and typed instead of a dict with the same string keys repeated in every
+## record. District, school, state and job title values are interned, so a district's records all
+## share one copy of each
+class StaffRecord:
+    # record key -> attribute, the output format
+    keys = {
+        "First Name": "first_name",
+        "Last Name": "last_name",
+        "Honorific": "honorific",
+        "Email Address": "email",
+        "Phone": "phone",
+        "School District": "district",
+        "School Name": "school",
+        "State": "state",
+    }
+    interned = ("honorific", "district", "school", "state")
+
+    __slots__ = ("first_name", "last_name", "honorific", "email", "phone", "district", "school", "state", "extra")
+
+    def __init__(
+        self,
+        first_name: str = None,
+        last_name: str = None,
+        honorific: str = None,
+        email: str = None,
+        phone: str = None,
+        district: str = None,
+        school: str = None,
+        state: str = None,
+        extra: dict = None, # parameters without an attribute (city, department...)
+    ):
+        self.first_name = StaffRecord.value(first_name)
+        self.last_name = StaffRecord.value(last_name)
+        self.honorific = StaffRecord.value(honorific, intern=True)
+        self.email = StaffRecord.value(email)
+        self.phone = StaffRecord.value(phone)
+        self.district = StaffRecord.value(district, intern=True)
+        self.school = StaffRecord.value(school, intern=True)
+        self.state = StaffRecord.value(state, intern=True)
+        self.extra = extra or None
+
+    # NaN and blanks are None, everything else a stripped str
+    def value(value, intern=False):
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            return None
+        value = str(value).strip()
+        if not value:
+            return None
+        return sys.intern(value) if intern else value
+
+    # From a record in dict form (e.g. a line of data.jsonl)
+    def from_dict(record):
+        values = {}
+        extra = {}
+        for key, value in record.items():
+            if key in StaffRecord.keys:
+                values[StaffRecord.keys[key]] = value
+            elif key != "url" and StaffRecord.value(value) is not None:
+                extra[key] = value
+        return StaffRecord(**values, extra=extra)
+
+    # Record in dict form, the output format. Missing parameters are left out
+    def to_dict(self) -> dict:
+        record = {}
+        for key, attribute in StaffRecord.keys.items():
+            value = getattr(self, attribute)
+            if value is not None:
+                record[key] = value
+        if self.extra:
+            for key, value in self.extra.items():
+                record.setdefault(key, value)
+        return record
+
+    def __eq__(self, other):
+        return isinstance(other, StaffRecord) and all(getattr(self, a) == getattr(other, a) for a in StaffRecord.__slots__)
+
+    def __repr__(self):
+        return f"StaffRecord({self.to_dict()})"
+
+
+## Output Sink
+## Append-only JSON Lines output, one staff member per line
+class JsonlSink:
+    path = "data.jsonl"
+    batch = 100 # fsync after this many records
+
+    def __init__(self, **kwargs):
+        self.path = kwargs.get("output_path", JsonlSink.path)
+        self.batch = kwargs.get("fsync_batch", JsonlSink.batch)
+        self.pending = 0
+
+        # a crash mid-write can leave a torn last line, dont glue the next record onto it
+        torn = False
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            with open(self.path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b"\n"
+
+        # lines are buffered here and appended with a single write per flush,
+        # so worker processes sharing the file never interleave halves of lines
+        self.lines = ["\n"] if torn else []
+        self.file = open(self.path, "ab", buffering=0)
+
+    # Append one record, `url` is the district website it was scrapped from
+    def write(self, record, url=None):
+        with Metrics.stage("output write"):
+            if isinstance(record, StaffRecord):
+                record = record.to_dict()
+            if url is not None:
+                record = {"url": url, **record}
+            self.lines.append(json.dumps(record, default=str) + "\n")
+
+        self.pending += 1
+        if self.pending >= self.batch:
+            self.flush()
+
+    def flush(self):
+        with Metrics.stage("output write"):
+            if self.lines:
+                self.file.write("".join(self.lines).encode("utf-8"))
+                self.lines = []
+            os.fsync(self.file.fileno())
+        self.pending = 0
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    # Stream records back from a JSON Lines file, one at a time
+    # Lines that arent valid JSON (e.g. torn by a crash) are skipped
+    def load(path=None):
+        with open(path or JsonlSink.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+    # Rewrite a JSON Lines file without duplicate (or torn) records, keeping the first copy
+    # Only a digest per record is held in memory
+    # Returns (records kept, duplicates dropped)
+    def compact(path=None):
+        path = path or JsonlSink.path
+        temp = f"{path}.compact"
+        seen = set()
+        kept, dropped = 0, 0
+
+        with open(temp, "w", encoding="utf-8") as f:
+            for record in JsonlSink.load(path):
+                line = json.dumps(record, sort_keys=True, default=str)
+                digest = hashlib.sha1(line.encode()).digest()
+                if digest in seen:
+                    dropped += 1
+                    continue
+
+                seen.add(digest)
+                f.write(json.dumps(record, default=str) + "\n")
+                kept += 1
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(temp, path)
+        return kept, dropped
+
+
+## SQLite Result Store
+## Optional output backend (`output` setting "sqlite"), records are upserted on a natural key so the
+## same person found through several subwebsites or tables is stored once, and queries dont need
+## the whole output loaded. Exports to CSV/Parquet stream from it.
+class SqliteSink:
+    path = "staff.db"
+    batch = 500 # records per transaction
+
+    # Record keys -> columns (the StaffRecord attributes), everything else goes into `extra` as JSON
+    columns = StaffRecord.keys
+
+    def __init__(self, **kwargs):
+        self.path = kwargs.get("store_path", SqliteSink.path)
+        self.batch = kwargs.get("store_batch", SqliteSink.batch)
+        self.rows = []
+
+        self.db = sqlite3.connect(self.path, timeout=60)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS staff (key TEXT PRIMARY KEY, url TEXT, first_name TEXT, last_name TEXT, "
+            "honorific TEXT, email TEXT, phone TEXT, district TEXT, school TEXT, state TEXT, extra TEXT, "
+            "seen INTEGER DEFAULT 1, updated_at REAL)"
+        )
+        for column in ("state", "district", "school"):
+            self.db.execute(f"CREATE INDEX IF NOT EXISTS staff_{column} ON staff ({column})")
+        self.db.commit()
+
+    # Natural key of a record: normalized email, or name + district when there is no usable email
+    def key(record):
+        email = record.get("email")
+        if email and "@" in email:
+            return "email:" + email.strip().lower()
+        name = " ".join(str(record.get(part) or "").strip().lower() for part in ("first_name", "last_name"))
+        return f"name:{name}|{str(record.get('district') or '').strip().lower()}"
+
+    # StaffRecord (or record dict) -> row of the staff table
+    def row(record, url=None):
+        if not isinstance(record, StaffRecord):
+            record = StaffRecord.from_dict(record)
+        row = {column: getattr(record, column) for column in SqliteSink.columns.values()}
+        row["url"] = url
+        row["extra"] = json.dumps(record.extra, default=str) if record.extra else None
+        row["key"] = SqliteSink.key(row)
+        row["updated_at"] = time.time()
+        return row
+
+    # Same interface as JsonlSink.write
+    def write(self, record, url=None):
+        with Metrics.stage("output write"):
+            self.rows.append(SqliteSink.row(record, url))
+        if len(self.rows) >= self.batch:
+            self.flush()
+
+    # Upsert the buffered records in one transaction, known values are never overwritten with NULLs
+    def flush(self):
+        if not self.rows:
+            return
+        fields = ["key", "url", *SqliteSink.columns.values(), "extra", "updated_at"]
+        updates = ", ".join(f"{field} = COALESCE(excluded.{field}, {field})" for field in fields[1:])
+        with Metrics.stage("output write"):
+            with self.db:
+                self.db.executemany(
+                    f"INSERT INTO staff ({', '.join(fields)}) VALUES ({', '.join('?' * len(fields))}) "
+                    f"ON CONFLICT(key) DO UPDATE SET {updates}, seen = seen + 1",
+                    [tuple(row.get(field) for field in fields) for row in self.rows],
+                )
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+    # Stream the staff table (optionally filtered by `where`, e.g. "state = 'Alabama'") into a CSV or
+    # Parquet file, `chunk` rows at a time
+    # Returns the number of rows exported
+    def export(out, path=None, where=None, chunk=50000):
+        db = sqlite3.connect(path or SqliteSink.path, timeout=60)
+        cursor = db.execute(f"SELECT * FROM staff{' WHERE ' + where if where else ''} ORDER BY rowid")
+        names = [column[0] for column in cursor.description]
+        rows = 0
+
+        try:
+            if out.endswith(".parquet"):
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+
+                types = {"seen": pa.int64(), "updated_at": pa.float64()}
+                schema = pa.schema([(name, types.get(name, pa.string())) for name in names])
+                with pq.ParquetWriter(out, schema) as writer:
+                    while True:
+                        batch = cursor.fetchmany(chunk)
+                        if not batch:
+                            break
+                        writer.write_table(pa.Table.from_pylist([dict(zip(names, row)) for row in batch], schema=schema))
+                        rows += len(batch)
+            else:
+                with open(out, "w", newline="", encoding="utf-8") as f:
+                    writer = csv.writer(f)
+                    writer.writerow(names)
+                    while True:
+                        batch = cursor.fetchmany(chunk)
+                        if not batch:
+                            break
+                        writer.writerows(batch)
+                        rows += len(batch)
+        finally:
+            db.close()
+
+        return rows
+
+
+## Parquet Output
+## Optional columnar output backend (`output` setting "parquet"), records are written straight from
+## their StaffRecord attributes as row groups, with the repetitive columns (url, district, school,
+## state, title) dictionary-encoded. Needs pyarrow
+class ParquetSink:
+    path = "staff.parquet"
+    batch = 10000 # records per row group
+
+    categorical = ("url", "honorific", "district", "school", "state")
+
+    def __init__(self, **kwargs):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.path = kwargs.get("parquet_path", ParquetSink.path)
+        self.batch = kwargs.get("parquet_batch", ParquetSink.batch)
+        self.records = []
+        self.urls = []
+
+        fields = ["url", *StaffRecord.keys.values(), "extra"]
+        self.schema = pa.schema([
+            (field, pa.dictionary(pa.int32(), pa.string()) if field in ParquetSink.categorical else pa.string())
+            for field in fields
+        ])
+        self.writer = pq.ParquetWriter(self.path, self.schema, compression="zstd")
+
+    # Same interface as JsonlSink.write
+    def write(self, record, url=None):
+        if not isinstance(record, StaffRecord):
+            record = StaffRecord.from_dict(record)
+        self.records.append(record)
+        self.urls.append(url)
+        if len(self.records) >= self.batch:
+            self.flush()
+
+    # Write the buffered records as one row group, a column at a time
+    def flush(self):
+        if not self.records:
+            return
+        pa = self.pa
+        with Metrics.stage("output write"):
+            columns = {"url": self.urls}
+            for attribute in StaffRecord.keys.values():
+                columns[attribute] = [getattr(record, attribute) for record in self.records]
+            columns["extra"] = [json.dumps(record.extra, default=str) if record.extra else None for record in self.records]
+
+            arrays = []
+            for field in self.schema:
+                array = pa.array(columns[field.name], type=pa.string())
+                arrays.append(array.dictionary_encode() if field.name in ParquetSink.categorical else array)
+            self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+        self.records = []
+        self.urls = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+## Incremental Recrawl
+## Content hashes of directory pages (with their iframes) and of extracted tables, with the records
+## they produced on the last successful run. Unchanged directories carry their records forward without
+## being extracted again, changed ones are diffed against them (added, removed, changed staff)
+class Fingerprints:
+    path = "fingerprints.db"
+
+    def __init__(self, **kwargs):
+        self.path = kwargs.get("fingerprints_path", Fingerprints.path)
+        self.run = time.time()
+
+        self.db = sqlite3.connect(self.path, timeout=60)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS directories (url TEXT PRIMARY KEY, digest TEXT, records TEXT, updated_at REAL, rendered TEXT)")
+        if "rendered" not in [column[1] for column in self.db.execute("PRAGMA table_info(directories)")]:
+            self.db.execute("ALTER TABLE directories ADD COLUMN rendered TEXT") # databases from before rendered iframes were kept
+        self.db.execute("CREATE TABLE IF NOT EXISTS tables (digest TEXT, id INTEGER, records TEXT, used_at REAL, PRIMARY KEY (digest, id))")
+        self.db.execute("CREATE TABLE IF NOT EXISTS diffs (run REAL, directory TEXT, change TEXT, key TEXT, record TEXT)")
+        self.db.commit()
+
+    # Digest of a directory page and its iframe pages (in `frames`, in page order)
+    # None if any of them failed to fetch, so the directory always counts as changed
+    def digest(page, frames=()):
+        h = hashlib.sha256(page if isinstance(page, bytes) else page.encode())
+        for frame in frames:
+            if isinstance(frame, Exception):
+                return None
+            h.update(b"\0")
+            h.update(frame if isinstance(frame, bytes) else frame.encode())
+        return h.hexdigest()
+
+    # Digest of an extracted table, columns and cells
+    def table_digest(df):
+        h = hashlib.sha256(json.dumps([str(column) for column in df.columns]).encode())
+        try:
+            h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+        except TypeError: # unhashable cells
+            h.update(df.to_csv(index=False).encode())
+        return h.hexdigest()
+
+    # (digest, records, iframe srcs that needed the browser) of a directory on the last successful run, or None
+    def directory(self, url):
+        row = self.db.execute("SELECT digest, records, rendered FROM directories WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        return row[0], Fingerprints.load(row[1]), json.loads(row[2] or "[]")
+
+    # Records of a table already seen for district `id`, or None
+    def table(self, digest, id):
+        row = self.db.execute("SELECT records FROM tables WHERE digest = ? AND id = ?", (digest, id)).fetchone()
+        return None if row is None else Fingerprints.load(row[0])
+
+    def store_table(self, digest, id, records):
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO tables VALUES (?, ?, ?, ?)",
+                (digest, id, Fingerprints.dump(records), time.time()),
+            )
+
+    # StaffRecords <-> JSON
+    def dump(records):
+        return json.dumps([record.to_dict() for record in records], default=str)
+
+    def load(text):
+        return [StaffRecord.from_dict(record) for record in json.loads(text)]
+
+    # Save a directory after a successful extraction, with the diff against its previous records
+    # `rendered` are the iframe srcs that were rendered in the browser
+    # Returns {"added": n, "removed": n, "changed": n}
+    def store_directory(self, url, digest, records, previous=None, rendered=()):
+        old = {SqliteSink.key(SqliteSink.row(record)): record for record in previous or []}
+        new = {SqliteSink.key(SqliteSink.row(record)): record for record in records}
+
+        changes = []
+        for key, record in new.items():
+            if key not in old:
+                changes.append(("added", key, record))
+            elif record != old[key]:
+                changes.append(("changed", key, record))
+        changes += [("removed", key, record) for key, record in old.items() if key not in new]
+
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO directories VALUES (?, ?, ?, ?, ?)",
+                (url, digest, Fingerprints.dump(records), time.time(), json.dumps(sorted(rendered))),
+            )
+            if previous is not None: # a first sighting isnt a diff
+                self.db.executemany(
+                    "INSERT INTO diffs VALUES (?, ?, ?, ?, ?)",
+                    [(self.run, url, change, key, json.dumps(record.to_dict(), default=str)) for change, key, record in changes],
+                )
+
+        summary = {"added": 0, "removed": 0, "changed": 0}
+        if previous is not None:
+            for change, key, record in changes:
+                summary[change] += 1
+        return summary
+
+    def close(self):
+        self.db.close()
+
+
+## District Metadata
+## District and school names per Excel id, computed once per district and shared by the run.
+## School names are scrapped from `district_url` once and kept in sqlite, so other worker
+## processes (and later runs) dont fetch them again
+class DistrictIndex:
+    path = "districts.db"
+
+    def __init__(self, **kwargs):
+        self.path = kwargs.get("districts_path", DistrictIndex.path)
+        self.districts = None # sheet row -> district name, from the Excel file
+        self.school_urls = None # sheet row -> district url
+        self.school_names = {} # sheet row -> school name, looked up this run
+
+        self.db = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS schools (id INTEGER PRIMARY KEY, url TEXT, name TEXT)") # id is the sheet row
+        self.db.commit()
+
+    # Columns are only read from the Excel file once, on first use
+    # Whole columns, so a blank cell doesnt shift the rows after it
+    def load(self):
+        if self.districts is None:
+            df = Utility.get_df()
+            self.districts = [None if pd.isna(name) else name for name in df["district_name"].tolist()]
+            self.school_urls = [None if pd.isna(url) else url for url in df["district_url"].tolist()]
+
+    # `id` is the district id, the position of its url in Utility.get_urls (see Utility.get_url_row)
+    def district(self, id):
+        self.load()
+        return self.districts[Utility.get_url_row(id)]
+
+    # School name from the #firstHeading of the district url
+    # Fetched at most once per district, failures are remembered for the run but not stored
+    def school_name(self, id):
+        row = Utility.get_url_row(id)
+        if row in self.school_names:
+            return self.school_names[row]
+
+        self.load()
+        url = self.school_urls[row]
+        if url is None:
+            self.school_names[row] = None
+            return None
+
+        stored = self.db.execute("SELECT name FROM schools WHERE id = ? AND url = ?", (row, url)).fetchone()
+        if stored is not None:
+            self.school_names[row] = stored[0]
+            return stored[0]
+
+        name = None
+        try:
+            heading = Utility.get_soup(url).find(id="firstHeading")
+            if heading is not None and heading.string is not None:
+                name = str(heading.string)
+        except Exception as e:
+            print(f"{colors.WARNING}DistrictIndex: couldnt get school name from {url}: {e}{colors.ENDC}")
+
+        self.school_names[row] = name
+        if name is not None:
+            self.db.execute("INSERT OR REPLACE INTO schools VALUES (?, ?, ?)", (row, url, name))
+            self.db.commit()
+        return name
+
+    def close(self):
+        self.db.close()
+
+
+## Work Queue
+## Durable queue of district urls in sqlite, shared by the worker processes of Scrapper.scrapes
+## Every url is pending, in_progress, done or failed
+class WorkQueue:
+    path = "queue.db"
+
+    def __init__(self, **kwargs):
+        self.path = kwargs.get("queue_path", WorkQueue.path)
+        # autocommit, claims take their own write lock with BEGIN IMMEDIATE
+        self.db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS items (
+            pos INTEGER PRIMARY KEY, url TEXT, state TEXT, attempts INTEGER DEFAULT 0,
+            worker INTEGER, error TEXT, updated_at REAL)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS items_state ON items (state, pos)")
+
+    # Add urls, positions start from 1 like the excel file
+    # Urls that are already queued keep their state, positions before `done_before` are added as done
+    def seed(self, urls, done_before=1):
+        now = time.time()
+        rows = []
+        for pos, url in enumerate(urls, start=1):
+            state = "done" if pos < done_before else "pending"
+            rows.append((pos, url, state, now))
+
+        self.db.execute("BEGIN IMMEDIATE")
+        self.db.executemany("INSERT OR IGNORE INTO items (pos, url, state, updated_at) VALUES (?, ?, ?, ?)", rows)
+        self.db.execute("COMMIT")
+
+    # Put urls that were in progress when the last run stopped back to pending
+    # Only call this while no workers are running
+    def recover(self):
+        return self.db.execute(
+            "UPDATE items SET state = 'pending', worker = NULL WHERE state = 'in_progress'"
+        ).rowcount
+
+    # Claim the next pending url for `worker`
+    # Returns (pos, url), or None if the queue is drained
+    def claim(self, worker):
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.db.execute("SELECT pos, url FROM items WHERE state = 'pending' ORDER BY pos LIMIT 1").fetchone()
+            if row is not None:
+                self.db.execute(
+                    "UPDATE items SET state = 'in_progress', worker = ?, attempts = attempts + 1, updated_at = ? WHERE pos = ?",
+                    (worker, time.time(), row[0]),
+                )
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+
+        return row
+
+    def done(self, pos):
+        self.db.execute("UPDATE items SET state = 'done', error = NULL, updated_at = ? WHERE pos = ?", (time.time(), pos))
+
+    def fail(self, pos, error):
+        self.db.execute("UPDATE items SET state = 'failed', error = ?, updated_at = ? WHERE pos = ?", (error, time.time(), pos))
 
-            if not isinstance(name, np.int64):
-                new_table[name] = new_params
+    # Put failed urls back to pending
+    def retry_failed(self):
+        return self.db.execute("UPDATE items SET state = 'pending' WHERE state = 'failed'").rowcount
+
+    # Put every url back to pending, i.e. start over from pos 1
+    def reset(self):
+        self.db.execute("UPDATE items SET state = 'pending', attempts = 0, worker = NULL, error = NULL")
+
+    # Number of urls per state
+    def counts(self):
+        return dict(self.db.execute("SELECT state, COUNT(*) FROM items GROUP BY state").fetchall())
+
+    def close(self):
+        self.db.close()
+
+
+## Table Utilities
+## For table manipulation
+class TableUtil:
 
-        return new_table
+    relevance_keywords = ["name", "grade", "title", "job", "city", "email", "position"]
+    relevance_threshold = 0.25 # tables scoring below this are dropped by Scrapper.find_staff
+    relevance_sample = 20 # rows looked at besides the headers
 
-    # Is the table relevant?
+    # How relevant is the table? Returns a score from 0 to 1
+    # Each keyword found in the headers counts 0.5, one only found in the sampled rows 0.25
+    # The first row counts as a header too, tables often have theirs there (see Parser.parse_table)
     # Only pass a DataFrame table in the `table` argument
-    def is_relevant(table: pd.DataFrame):
+    def is_relevant(table: pd.DataFrame) -> float:
         try:
-            keywords = ["name", "grade", "title", "job", "city", "email", "position"]
-            relevant = False
-            for index, row in table.iterrows():
-                for keyword in keywords:
-                    if keyword in row.to_string().lower():
-                        relevant = True
-
-            return relevant
+            keywords = TableUtil.relevance_keywords
+            sample = table.head(TableUtil.relevance_sample + 1)
+
+            headers = pd.Series([str(column) for column in table.columns] + list(sample.head(1).to_numpy().ravel()))
+            headers = headers.dropna().astype(str).str.lower().str.cat(sep=" ")
+            cells = pd.Series(sample.iloc[1:].to_numpy().ravel())
+            cells = cells.dropna().astype(str).str.lower().str.cat(sep=" ")
+
+            in_headers = sum(keyword in headers for keyword in keywords)
+            in_cells = sum(keyword in cells and keyword not in headers for keyword in keywords)
+
+            return min(1.0, 0.5 * in_headers + 0.25 * in_cells)
         except Exception as e:
             print(f"Utility.is_relevant: {e}")
+            return 0.0
 
     # Turn a Table (HTML) into a pd.DataFrame
     def table_into_df(table):
@@ -233,105 +2261,99 @@ class Parser:
 
     def parse_table(table):
         """
-        Parse a DataFrame table into a dictionary, making it easier to use and store.
-        Also cleans the parsed table through Utility.clean_table
+        Parse a DataFrame table into a table of people, one row per person, name column first.
+        The whole table is handled column-wise, no per-cell python calls.
+
+        If the table has no header of its own (pd.read_html gives integer columns), its first row
+        becomes the header. Columns without a text header and rows without a name are dropped,
+        and a name that occurs twice keeps its last row.
 
         Returns:
-            A dict with the format:
-                full name : [parameters]
+            A DataFrame with the format:
+                full name | parameters...
                 e.g.
-                    'Wilson, Ray': {'Job Title': 'Principal'}
+                    Staff Name  | Job Title
+                    Wilson, Ray | Principal
         """
 
-        table = table.reset_index()
         table = table.dropna(how="all") # drop rows with all NaN values
-
-        data = {} # parsed table
-
-        table.columns = table.iloc[0]
-        table = table[1:]
-
-        """
-        # look for name row
-        keywords = ["Name", "Staff Name", "Staff", "Contact", "Contact Name"]
-        row_name = ''
-        for index, row in table.iterrows():
-            for ro in row:
-                print(f"ro {ro}")
-                if isinstance(ro, str):
-                    if ro.lower().startswith("name") or ro.lower().startswith("staff"):
-                        row_name = str(ro)
-
-        for index, row in table.iterrows():
-            name = row[row_name]
-            data[name] = {col: row[col] for col in table.columns if col != row_name}
-        """
-        data = table.to_dict()
-        data = TableUtil.clean_table(data)
-        # data = {'Staff Name': {1: etc, 2:etc}, etc}
-        # we must restructure into appropriate return dict
-
-        new_data = {}
-        name_key = list(data.keys())[0]
-        for pos, name in data[name_key].items():
-            # name = elizabeth shaddix
-            # key = pos
-            # now go thru data and assign values
-            values_to_assign = {}
-            for p_key, p_values in data.items():
-                if p_key == name_key:
-                    pass
-                else:
-                    k_to_assign = p_key
-                    v_to_assign = p_values[pos]
-                    values_to_assign[k_to_assign] = v_to_assign
-
-            new_data[name] = values_to_assign
-
-        
-        return new_data
+        if table.empty:
+            return table
+
+        if all(isinstance(column, (int, np.integer)) for column in table.columns):
+            table.columns = table.iloc[0]
+            table = table.iloc[1:]
+
+        # only text headers are parameters, and only once each
+        keep = [isinstance(column, str) for column in table.columns]
+        table = table.loc[:, keep]
+        table = table.loc[:, ~table.columns.duplicated()]
+        if table.empty:
+            return table
+
+        name_key = table.columns[0]
+        table = table[table[name_key].notna()]
+        table = table.drop_duplicates(subset=name_key, keep="last")
+
+        return table.reset_index(drop=True)
+
+    # Vectorized Utility.replace_name over a column of names
+    # Returns (first names, last names)
+    def split_names(names: pd.Series):
+        names = names.astype(str).str.strip()
+        first, last = names.copy(), names.copy()
+        done = pd.Series(False, index=names.index)
+
+        # Lastname, Firstname / Firstname Lastname / mr/mrs.name
+        for sep, last_first in ((",", True), (" ", False), (".", False)):
+            mask = ~done & names.str.contains(sep, regex=False)
+            if mask.any():
+                parts = names[mask].str.split(sep, n=1)
+                head, tail = parts.str[0], parts.str[1]
+                first[mask] = tail if last_first else head
+                last[mask] = head if last_first else tail
+                done |= mask
+
+        return first.str.replace(" ", "", regex=False), last.str.replace(" ", "", regex=False)
 
     def process_implications(table, id):
         """
         Process 'implications' of parameters.
         Basically adds those parameters to the table that weren't available on the school website itself.
 
-        Only pass a parsed and processed `table`.
-        Or just use `Utility.process_into_parameters`, which does everything automatically.
+        Only pass a parsed and processed `table` (DataFrame).
+        Or just use `Parser.process_into_parameters`, which does everything automatically.
 
         `id` is the location of the Excel file from where from where the table has been extracted.
-        Parameters this method adds to each entry:
+        Parameters this method adds to each entry (as whole columns):
             School District
             State
             School Name
         """
-        if not table:
-            return
-        ## Fetch relevant data
-        # Fetch district
-        districts = Utility.get_from_excel("district_name")
-        district = districts[id]
-
-        # Fetch school name from district url
-        school_url = Utility.get_from_excel("district_url")[id]
-        resp = requests.get(school_url)
-        temp = BeautifulSoup(resp.content, 'html.parser')
-
-        school_name = temp.find(id="firstHeading").string
+        if table is None or table.empty:
+            return table
 
         ## Append that data
-        for entry in table:
-            entry["School District"] = district
-            entry["School Name"] = school_name
-
-            # also add filler/common parameters
-            entry["State"] = "Alabama"
+        for key, value in Parser.implications(id).items():
+            table[key] = value
 
         return table
 
+    # The implied parameters of district `id`, looked up once per district (see `DistrictIndex`)
+    def implications(id) -> dict:
+        districts = Utility.get_district_index()
+        return {
+            "School District": districts.district(id),
+            "School Name": districts.school_name(id),
+            # also add filler/common parameters
+            "State": "Alabama",
+        }
+
     def process_into_parameters(table, id):
         """
-        Processes a parsed table into the set parameters.
+        Processes a parsed table (see `Parser.parse_table`) into the set parameters.
+        Headers are mapped once per column (eg Job Title -> Honorific) and names are split
+        for the whole name column at once.
 
         Parameters:
             State
@@ -345,70 +2367,110 @@ class Parser:
             First Name
             Honorific
             Email Address
+            Phone
 
-        Parameters not found have `None` as the value.
+        Parameters not found are `None`, parameters without a StaffRecord attribute
+        (city, department...) go into its `extra` dict.
 
         Returns:
-            A list containing dicts, of which each dict represents ONE individual.
-            For example:
-                [ {'first name': etc, 'state': etc } ]
+            A list of StaffRecord, each representing ONE individual.
+            `StaffRecord.to_dict` gives the dict form:
+                {'First Name': etc, 'State': etc }
         """
-
-        data = [] # processed table
-
-        for name, values in table.items():
-            processed_values = {}
-            # replace values
-            for key, value in values.items():
-                bundle = Utility.replace_into_params(key, value)
-                new_key, new_value = bundle[0], bundle[1]
-                processed_values[new_key] = new_value
-
-            # replace name
-            processed_name = Utility.replace_name(name)
-            first_name, last_name = processed_name[0], processed_name[1]
-
-            # finally, collect and then append the processed individual entry to `data`
-            entry = {}
-            entry["First Name"] = first_name
-            entry["Last Name"] = last_name
-            for processed_k, processed_v in processed_values.items():
-                entry[processed_k] = processed_v
-
-
-            data.append(entry)
-
-        # Add implicational parameters
-        data = Parser.process_implications(data, id)
-
-        return data
+        if table.empty:
+            return []
+
+        name_key = table.columns[0]
+        first_names, last_names = Parser.split_names(table[name_key])
+
+        # replace keys, a later column wins if two map to the same parameter
+        values = table.drop(columns=name_key)
+        values.columns = [Utility.replace_into_params(str(key), "")[0] for key in values.columns]
+        values = values.loc[:, ~values.columns.duplicated(keep="last")]
+
+        # Add implicational parameters, one interned value for the whole table
+        implied = {StaffRecord.keys[key]: StaffRecord.value(value, intern=True) for key, value in Parser.implications(id).items()}
+
+        # one tolist per column, DataFrame.to_dict boxes every cell on its own
+        attributes = [StaffRecord.keys.get(key) for key in values.columns]
+        columns = [first_names.tolist(), last_names.tolist()] + [values[key].tolist() for key in values.columns]
+        records = []
+        for row in zip(*columns):
+            record = StaffRecord(first_name=row[0], last_name=row[1], **implied)
+            extra = None
+            for key, attribute, value in zip(values.columns, attributes, row[2:]):
+                if attribute is not None:
+                    setattr(record, attribute, StaffRecord.value(value, intern=attribute in StaffRecord.interned))
+                elif StaffRecord.value(value) is not None:
+                    extra = extra or {}
+                    extra[key] = value
+            record.extra = extra
+            records.append(record)
+
+        return records
 
 
 ## Methods to extract data from a staff directory page
 class Extractor:
 
+    host_tiers = {} # host -> "static" or "browser", the tier that last got tables out of it
+    tier_counts = {"static": 0, "browser": 0} # pages each tier got tables out of
+
     # Iframe method
     # Searches for tables in the form of iframes in page, then process and return as list of DataFrames
-    def extr_iframe(soup) -> list:
+    # Each src is first fetched as plain HTML (through `fetcher` if given), and only rendered
+    # in Chrome if that gives no usable table, or if its host is known to need the browser
+    # `pages` is {src: raw page} of srcs that were already fetched, srcs rendered in Chrome are added to `rendered`
+    def extr_iframe(soup, fetcher=None, pages=None, rendered=None) -> list:
         tables = []
-        # get iframe srcs
-        # one page can have multiple iframe srcs and therefore multiple tables
-        iframes = soup.find_all('iframe')
-        srcs = [] # -> urls
-        for iframe in iframes:
-            srcs.append(iframe['src'])
+        srcs = Extractor.iframe_srcs(soup)
+
+        # static tier, fetch every src whose host isnt known to need the browser
+        static = dict(pages or {})
+        wanted = [src for src in srcs if src not in static and Extractor.host_tiers.get(urlparse(src).netloc) != "browser"]
+        if fetcher is not None:
+            fetched = fetcher.get_pages(wanted)
+        else:
+            fetched = []
+            for src in wanted:
+                try:
+                    fetched.append(Utility.fetch(src))
+                except Exception as e:
+                    fetched.append(e)
+        static.update(zip(wanted, fetched))
 
         # process srcs by opening them, turning them into dataframe tables thru pandas
         # and then append them to the `tables` variable
         for src in srcs:
-            if "googletag" in src:
-                print(f"{colors.OKBLUE}ignoring {src} {colors.ENDC}")
-                continue
-
-            html = Utility.get_selenium(src)
-
-            data = BeautifulSoup(html, "html.parser")
-            tables_inpage = data.find_all('table')
+            host = urlparse(src).netloc
+            tables_inpage = []
+
+            page = static.get(src)
+            fetched = page is not None and not isinstance(page, Exception)
+            if fetched:
+                data = Utility.make_soup(page, "tables")
+                tables_inpage = data.find_all('table')
+                tier = "static"
+
+                if Extractor.looks_js_rendered(tables_inpage):
+                    tables_inpage = []
+
+            # browser tier
+            if not tables_inpage:
+                html = Utility.get_selenium(src)
+                if rendered is not None:
+                    rendered.add(src)
+
+                data = Utility.make_soup(html, "tables")
+                tables_inpage = data.find_all('table')
+                tier = "browser"
+
+            if tables_inpage:
+                # the host only needs the browser if its static page came back without tables,
+                # not if the static fetch failed (timeout, open circuit)
+                if tier == "static" or fetched:
+                    Extractor.host_tiers[host] = tier
+                Extractor.tier_counts[tier] += 1
 
             for table in tables_inpage:
                 df = TableUtil.table_into_df(table)
@@ -416,98 +2478,270 @@ class Extractor:
 
         return tables
 
-    def extr_match(url):
-        # This is a list of pattern specifications. The "match" key is an XPath
-        # expression that identifies a top-level element that contains both the name
-        # and email address. The "name" and "email" keys are callables that when
-        # evaluated on the matched element return the desired data.
-        patterns = [
-            {
-                "match": "//tr[(td/strong) and (td/a[contains(@href, 'mailto:')])]",
-                "name": lambda ele: ele.find_element(By.XPATH, "td/strong").get_attribute(
-                    "textContent"
-                ),
-                "email": lambda ele: ele.find_element(By.XPATH, "td/a").get_attribute("href"),
-            },
-
-            {
-                "match": "//tr[td/table//a[contains(@href, 'mailto:')]]",
-                "name": lambda ele: ele.find_element_by_xpath("td//strong").get_attribute(
-                    "textContent"
-                ),
-                "email": lambda ele: ele.find_element_by_xpath("td//td/a").get_attribute(
-                    "href"
-                ),
-            },
-
-            {
-                "match": "//div[span/a[contains(@href, 'mailto')]]",
-                "name": lambda ele: ele.find_element_by_xpath(
-                    "./preceding-sibling::div[1]/span"
-                ).get_attribute("textContent"),
-                "email": lambda ele: ele.find_element_by_xpath("span/a").get_attribute("href"),
-            },
-        ]
-
-        driver = Utility.get_selenium_raw()
-        driver.get(url)
-        all_contacts = {}
+    # get iframe srcs
+    # one page can have multiple iframe srcs and therefore multiple tables
+    def iframe_srcs(soup) -> list:
+        srcs = [] # -> urls
+        for iframe in soup.find_all('iframe', src=True):
+            src = iframe['src']
+            if src.startswith("//"):
+                src = f"https:{src}"
 
-        matches = driver.find_elements(By.XPATH, '//a[contains(@href, "mailto:")]')
-        all_emails = set(x.get_attribute("href") for x in matches)
-        print(f"expecting {len(all_emails)} contacts")
+            if "googletag" in src:
+                print(f"{colors.OKBLUE}ignoring {src} {colors.ENDC}")
+                continue
+            srcs.append(src)
+
+        return srcs
+
+    # Do the tables of a plain HTTP fetch look like they are filled in by JavaScript?
+    # True if there are no tables, or none of them has a single non-empty cell
+    def looks_js_rendered(tables) -> bool:
+        for table in tables:
+            for cell in table.find_all(['td', 'th']):
+                if cell.get_text(strip=True):
+                    return False
+
+        return True
+
+    # Pattern library for extr_match. The "match" key is an XPath expression that identifies
+    # a top-level element that contains both the name and email address, "name" and "email"
+    # are XPath expressions relative to the matched element.
+    # More patterns can be added through the `match_patterns` setting (or key of config.json)
+    match_patterns = [
+        {
+            "match": "//tr[(td/strong) and (td/a[contains(@href, 'mailto:')])]",
+            "name": "td/strong",
+            "email": "td/a/@href",
+        },
+        {
+            "match": "//tr[td/table//a[contains(@href, 'mailto:')]]",
+            "name": "td//strong",
+            "email": "td//td/a/@href",
+        },
+        {
+            "match": "//div[span/a[contains(@href, 'mailto')]]",
+            "name": "./preceding-sibling::div[1]/span",
+            "email": "span/a/@href",
+        },
+    ]
+
+    # First result of a relative XPath expression, as stripped text
+    def xpath_text(element, expression):
+        found = element.xpath(expression)
+        if not found:
+            return None
+        found = found[0]
+        text = found.text_content() if hasattr(found, "text_content") else str(found)
+        return " ".join(text.split()) or None
+
+    # Matching name and email patterns on a page snapshot
+    # The page is parsed once and every pattern is evaluated in-process with lxml XPath.
+    # Pass the raw page in `html`, or a `url` to snapshot it once through Utility.get_selenium
+    # `extra_patterns` are tried after the built-in ones, eg the `match_patterns` setting
+    # Returns a DataFrame with Name and Email Address columns, ready for Parser.parse_table
+    def extr_match(url=None, html=None, extra_patterns=()) -> pd.DataFrame:
+        from lxml import etree, html as lxml_html
+
+        if html is None:
+            html = Utility.get_selenium(url)
+        patterns = Extractor.match_patterns + list(extra_patterns)
+
+        contacts = {}
+        try:
+            root = lxml_html.fromstring(html)
+        except (ValueError, etree.ParserError):
+            return pd.DataFrame(columns=["Name", "Email Address"])
+
+        for pattern in patterns:
+            for match in root.xpath(pattern["match"]):
+                name = Extractor.xpath_text(match, pattern["name"])
+                email = Extractor.xpath_text(match, pattern["email"])
+                if not name or not email:
+                    continue # if we fail to process something, just skip it and move on
+
+                email = email[len("mailto:"):] if email.lower().startswith("mailto:") else email
+                contacts[name] = email.split("?")[0].strip()
+
+        Metrics.count("match contacts", len(contacts))
+        return pd.DataFrame({"Name": list(contacts.keys()), "Email Address": list(contacts.values())})
+    
+    # Block elements a staff member usually gets one of: table rows, list items, cards, paragraphs
+    ner_blocks = ["tr", "li", "p", "div", "article", "section", "dd"]
+    ner_titles = [
+        "principal", "teacher", "counselor", "coach", "librarian", "secretary", "nurse", "superintendent",
+        "director", "assistant", "coordinator", "specialist", "aide", "administrator", "bookkeeper", "instructor",
+    ]
+    # Pipeline components the entities dont depend on, skipped in extr_ner
+    ner_unused = ["tagger", "morphologizer", "parser", "senter", "attribute_ruler", "lemmatizer", "textcat", "textcat_multilabel"]
+    segment_pattern = re.compile(r"\s+[-\u2013|]\s+|,\s+")
+    segment_separators = " -\u2013|,\t\n" # stripped off segments, `Jane Doe - Principal -` has no space after the last one
+    email_pattern = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+
+    # Candidate text blocks of a page for NER: short blocks without nested blocks of their own
+    # Returns a list of (text, [emails], [text segments])
+    def ner_candidates(soup, max_length=300):
+        candidates = []
+        seen = set()
+        for block in soup.find_all(Extractor.ner_blocks):
+            if block.find(Extractor.ner_blocks) is not None:
+                continue # the nested blocks are candidates themselves
+
+            segments = [part.strip(Extractor.segment_separators) for string in block.stripped_strings for part in Extractor.segment_pattern.split(string)]
+            segments = [segment for segment in segments if segment]
+            text = " | ".join(segments)
+            if len(text) < 3 or len(text) > max_length or text in seen:
+                continue
+            seen.add(text)
 
-        for patternSpec in patterns:
-            matches = driver.find_elements(By.XPATH, patternSpec["match"])
-            for match in matches:
-                try:
-                    c_name = patternSpec["name"](match)
-                    c_email = patternSpec["email"](match)
-                except selenium.common.exceptions.NoSuchElementException:
-                    # if we fail to process something, just skip it and move on
-                    continue
+            emails = [a["href"][len("mailto:"):].split("?")[0] for a in block.find_all("a", href=True) if a["href"].startswith("mailto:")]
+            emails += [email for email in Extractor.email_pattern.findall(text) if email not in emails]
+            candidates.append((text, emails, segments))
 
-                all_contacts[c_name] = c_email
+        return candidates
 
-        print(f"all contacts: {all_contacts}")
-        print("missing:", all_emails.difference(all_contacts.values()))
-    
     # Using NER to extract data
-    def extr_ner(nlp, soup):
-        print("entered ner")
-        text = soup.get_text()
-
-        sents = nlp(text)
-        names = []
-        emails = []
-
-        temp = sents.ents
-        for e in temp:
-            print(e.label)
-        
+    # Feeds the candidate blocks of a full page soup through `nlp.pipe` in batches, with every component
+    # except the NER (and the tok2vec it listens to, if any) disabled, and pulls out PERSON entities
+    # with the emails and job titles found in the same block.
+    # Returns a DataFrame with Name, Title and Email Address columns, ready for Parser.parse_table
+    def extr_ner(nlp, soup, batch_size=64, n_process=1) -> pd.DataFrame:
+        candidates = Extractor.ner_candidates(soup)
+
+        disable = [name for name in nlp.pipe_names if name in Extractor.ner_unused]
+        if "tok2vec" in nlp.pipe_names and "ner" not in getattr(nlp.get_pipe("tok2vec"), "listening_components", []):
+            disable.append("tok2vec") # ner has its own tok2vec, as in en_core_web_md
+
+        texts = [text for text, emails, segments in candidates]
+        rows = []
+        for doc, (text, emails, segments) in zip(nlp.pipe(texts, batch_size=batch_size, n_process=n_process, disable=disable), candidates):
+            people = [ent.text.strip() for ent in doc.ents if ent.label_ == "PERSON"]
+            if not people:
+                continue
 
+            title = None
+            for segment in segments:
+                lowered = segment.lower()
+                if people[0] not in segment and any(keyword in lowered for keyword in Extractor.ner_titles):
+                    title = segment
+                    break
 
+            rows.append({"Name": people[0], "Title": title, "Email Address": emails[0] if emails else None})
+
+        Metrics.count("ner blocks", len(texts))
+        return pd.DataFrame(rows, columns=["Name", "Title", "Email Address"])
+
+
+## Directory Ranking
+## Scores staff directory candidates of a subwebsite from their url path, anchor text and position
+## on the page, so the likely directories are crawled first and the rest can be cut by the budget
+class DirectoryRanker:
+    # url path words, the keywords find_directories always matched on come first
+    path_words = {
+        "staff": 2.0, "faculty": 2.0, "teachers": 1.5, "board": 0.5, "department": 0.5,
+        "directory": 2.0, "employee": 1.0, "personnel": 1.0, "contact": 0.5, "our-team": 1.0,
+    }
+    # anchor text words
+    text_words = {
+        "staff directory": 3.0, "directory": 1.5, "staff": 1.5, "faculty": 1.5, "teachers": 1.0,
+        "meet": 0.5, "our team": 1.0, "contact": 0.5,
+    }
+    # pages that match the keywords but arent directories: board meetings, department news...
+    penalties = {
+        "minutes": -2.0, "agenda": -2.0, "meeting": -1.5, "policy": -1.5, "policies": -1.5, "news": -1.5,
+        "calendar": -1.5, "event": -1.0, "handbook": -1.0, "login": -2.0, "apply": -1.0, "job": -1.0, "employment": -1.0,
+    }
+    # never directories, these cant hold an HTML table
+    skipped = (".pdf", ".doc", ".docx", ".xls", ".xlsx", ".ppt", ".pptx", ".jpg", ".jpeg", ".png", ".zip", ".mp3", ".mp4")
+    position_weight = 0.5 # bonus for the first link on the page, decreasing to 0 for the last
+    min_score = 0.5 # candidates below are dropped
+
+    confident_relevance = 0.75 # TableUtil.is_relevant score of a high-confidence staff table
+    confident_rows = 5 # and its minimum number of people
+
+    # Score of a link, None if it isnt a directory candidate
+    # The query counts as part of the path, CMSs route pages through it (eg /index.php?page=staff)
+    def score(href, text, position=0, total=1):
+        parts = urlparse(href)
+        path = parts.path.lower() or href.lower()
+        if path.endswith(DirectoryRanker.skipped) or href.startswith(("mailto:", "tel:", "javascript:", "#")):
+            return None
+        if parts.query:
+            path = f"{path}?{parts.query.lower()}"
+
+        text = " ".join(text.lower().split())
+        score = sum(weight for word, weight in DirectoryRanker.path_words.items() if word in path)
+        score += sum(weight for word, weight in DirectoryRanker.text_words.items() if word in text)
+        if score <= 0:
+            return None
+
+        score += sum(weight for word, weight in DirectoryRanker.penalties.items() if word in path or word in text)
+        score += DirectoryRanker.position_weight * (1 - position / max(total, 1))
+        return score if score >= DirectoryRanker.min_score else None
+
+    # Candidates of a links soup, [(score, halflink)] best first
+    def rank(soup):
+        links = soup.find_all('a', href=True)
+        best = {}
+        for position, link in enumerate(links):
+            halflink = link['href'].strip()
+            score = DirectoryRanker.score(halflink, link.get_text(" "), position, len(links))
+            if score is not None and score > best.get(halflink, float("-inf")):
+                best[halflink] = score
 
+        return sorted(((score, halflink) for halflink, score in best.items()), key=lambda pair: pair[0], reverse=True)
 
+    # Is this a high-confidence staff table? `table` is the DataFrame from find_staff, `records` what it produced
+    def confident(table, records):
+        return table.attrs.get("relevance", 0.0) >= DirectoryRanker.confident_relevance and len(records) >= DirectoryRanker.confident_rows
 
-    
 
-    
 ## Scrapper class
 ## Interface
-class Scrapper:
-    def __init__(self):
+# Raised by Scrapper.scrape_iter when the homepage of a district couldnt be scrapped
+class HomepageError(Exception):
+    pass
 
-        try:
-            self.nlp = spacy.load("en_core_web_md")
-        except OSError:
-            print('Downloading language model for the spaCy POS tagger\n'
-                "(don't worry, this will only happen once)")
-            download('en_core_web_md')
-            self.nlp = spacy.load('en_core_web_md')
 
+class Scrapper:
+    sinks = {"jsonl": JsonlSink, "sqlite": SqliteSink, "parquet": ParquetSink} # output backends, by the `output` setting
+    directory_budget = 60 # directory pages crawled per district
+    district_time_budget = 900 # seconds spent on the directories of a district
+
+    def __init__(self, **kwargs):
+        # kwargs override the settings in config.json
+        self.settings = {**Utility.get_config(), **kwargs}
+        Utility.parser = self.settings.get("html_parser", Utility.parser)
+        TableUtil.relevance_threshold = self.settings.get("relevance_threshold", TableUtil.relevance_threshold)
+        Metrics.configure(**self.settings)
+        if self.settings.get("http_cache", True):
+            Utility.http_cache = ResponseCache(**self.settings)
+        self.fetcher = Fetcher(**self.settings)
+        Utility.driver_pool = DriverPool(**self.settings)
+        Utility.district_index = DistrictIndex(**self.settings)
+
+        self._nlp = None
         self.parsed = []
-
+        self.frontier = CrawlFrontier(**self.settings)
+        self.errors = 0 # subwebsites and directories that failed in the last self.scrape_iter
+        self.fingerprints = Fingerprints(**self.settings) if self.settings.get("incremental", False) else None
+
+    # spaCy model, only loaded once something actually uses it
+    @property
+    def nlp(self):
+        if self._nlp is None:
+            self._nlp = Utility.get_nlp()
+        return self._nlp
+
+    def close(self):
+        self.fetcher.close()
+        Metrics.close()
+        Utility.driver_pool.close()
+        Utility.district_index.close()
+        if Utility.http_cache is not None:
+            Utility.http_cache.close()
+        if self.fingerprints is not None:
+            self.fingerprints.close()
 
 
     ## Finders
@@ -529,9 +2763,11 @@ class Scrapper:
 
         # eliminate blubber
         subwebsites = []
+        seen = set() # to avoid adding duplicates
         for link in links:
             if link.startswith("http") and link.count('/') <= 3:
-                if not link in subwebsites: # to avoid adding duplicates
+                if not link in seen:
+                    seen.add(link)
                     subwebsites.append(link)
 
         return subwebsites
@@ -540,29 +2776,24 @@ class Scrapper:
     def find_directories(self, soup) -> list:
         """
         Method for finding staff directories from a school website
-        Not that accurate since it only operates on a list of keywords, but it does the job.
+        Links are scored from their url path, anchor text and position on the page (see `DirectoryRanker`),
+        documents and links that only look like directories (board minutes, department news) are dropped.
 
         Returns:
-            A list of strings containing directories, but not full URLs
+            A list of (score, halflink) of directories, the halflinks are not full URLs, most likely first
         """
-        keywords = ['staff', 'faculty', 'teachers', 'board', 'department']
-        links = soup.find_all('a', href=True)
-
-        directories = []
-        for link in links:
-            halflink = link['href']
-            for keyword in keywords:
-                if keyword in halflink:
-                    directories.append(halflink)
-                    break
-
-        return list(set(directories))
+        return DirectoryRanker.rank(soup)
     
-    def find_staff(self, soup, check=True) -> list:
+    def find_staff(self, soup, check=True, html=None, pages=None, rendered=None) -> list:
         """
         Method for finding staff data from a page
         Pass a staff directory soup in the `soup` argument.
-        `check` is for checking whether the tables are relevant, through `TableUtils.is_relevant`
+        `check` is for checking whether the tables are relevant, through `TableUtil.is_relevant`
+        Relevant tables are returned best scoring first.
+        `html` is the raw page, needed by the matching method (`match` setting, on by default)
+        and the NER fallback for pages without tables (`ner` setting, off by default).
+        `pages` is {src: raw page} of iframes that were already fetched,
+        iframes that had to be rendered in the browser are added to the `rendered` set.
 
         Uses a variety of methods from `Extractor` class to extract relevant data.
 
@@ -572,30 +2803,105 @@ class Scrapper:
         data = []
 
         # iframe method
-        data = Extractor.extr_iframe(soup)
+        with Metrics.stage("table extraction"):
+            data = Extractor.extr_iframe(soup, fetcher=self.fetcher, pages=pages, rendered=rendered)
 
         if check:
-            new_data = []
+            scored = []
             for table in data:
-                if TableUtil.is_relevant(table):
-                    new_data.append(table)
+                with Metrics.stage("relevance filter"):
+                    score = TableUtil.is_relevant(table)
+                table.attrs["relevance"] = score
+                if score >= TableUtil.relevance_threshold:
+                    scored.append((score, table))
+
+            scored.sort(key=lambda pair: pair[0], reverse=True)
+            data = [table for score, table in scored]
+
+        # matching method, for name and email contacts outside of tables
+        if html is not None and self.settings.get("match", True) and "mailto:" in (html.decode(errors="ignore") if isinstance(html, bytes) else html):
+            with Metrics.stage("matching"):
+                contacts = Extractor.extr_match(html=html, extra_patterns=self.settings.get("match_patterns", []))
+            if not contacts.empty:
+                data.append(contacts)
+
+        # NER method, for directories without tables
+        if not data and html is not None and self.settings.get("ner", False):
+            with Metrics.stage("ner"):
+                people = Extractor.extr_ner(
+                    self.nlp,
+                    Utility.make_soup(html),
+                    batch_size=self.settings.get("ner_batch_size", 64),
+                    n_process=self.settings.get("ner_processes", 1),
+                )
+            if not people.empty:
+                data = [people]
 
-            data = new_data
+        return data
 
+    def extract(self, soup, html, id, pages=None, rendered=None) -> list:
+        """
+        Staff records of one directory page, through self.extract_tables()
+        Every table is normalized before returning, so a bad table doesnt leave the directory half done.
 
-        return data
+        Returns:
+            (list of tables, each a list of StaffRecord, whether one of them is a high-confidence staff table)
+        """
+        processed = []
+        confident = False
+        for records, table_confident in self.extract_tables(soup, html, id, pages, rendered):
+            processed.append(records)
+            confident = confident or table_confident
 
-    def scrape(self, url, id, **kwargs):
+        return processed, confident
+
+    def extract_tables(self, soup, html, id, pages=None, rendered=None):
         """
-        Wrapper over the Scrapper class methods.
-        Scrapes a single school website and multiple sub-websites and directories within it (if any).
+        Streaming version of self.extract()
+        Staff records of one directory page, through self.find_staff() and `Parser`, normalized one table at a time.
+        In incremental mode, tables already seen for the district are not normalized again.
+
+        Yields:
+            (list of StaffRecord of a table, whether it is a high-confidence staff table)
+        """
+        for df in self.find_staff(soup, html=html, pages=pages, rendered=rendered):
+            digest = Fingerprints.table_digest(df) if self.fingerprints is not None else None
+            records = self.fingerprints.table(digest, id) if digest is not None else None
+
+            if records is None:
+                with Metrics.stage("normalization"):
+                    parsed = Parser.parse_table(df)
+                    records = Parser.process_into_parameters(parsed, id)
+                if digest is not None:
+                    self.fingerprints.store_table(digest, id, records)
+            else:
+                Metrics.count("tables unchanged")
+
+            Metrics.count("tables")
+            yield records, DirectoryRanker.confident(df, records)
+
+    def scrape_iter(self, url, id, **kwargs):
+        """
+        Streaming version of self.scrape()
+        Scrapes a single school website and multiple sub-websites and directories within it (if any),
+        yielding normalized staff records (StaffRecord) as soon as each table is processed.
 
         The `id` parameter is the place of the url in the excel file, starting from 1.
+        Directories are fetched a few at a time (`fetch_window` setting) and a directory that fails
+        is reported and skipped, so one table is held in memory at a time (plus the pages in the fetch window).
+        In incremental mode records are diffed per directory, so they come once their whole directory is processed.
 
-        Returns:
-            List with scrapped data in dictionary form.
+        Directories are crawled best-first (see `DirectoryRanker`), within a page and time budget per district
+        (`directory_budget`, `district_time_budget` settings). Once a directory gives a high-confidence staff
+        table, the remaining directories of its subwebsite are skipped (`directory_early_stop` setting).
+
+        Subwebsites and directories that failed are counted in `self.errors`.
 
+        Raises:
+            HomepageError, if the homepage itself couldnt be scrapped.
         """
+        self.errors = 0
+
         # Handle kwargs
         silent = kwargs.get("silent", False) # for errors
         log_info = kwargs.get("log_info", True) # for info
@@ -605,118 +2911,295 @@ class Scrapper:
 
         # Collect subwebsites
         try:
-            soup = Utility.get_soup(url)
-            subwebsites = self.find_subwebsites(soup)
+            soup = self.fetcher.get_soup(url, mode="links")
+            subwebsites = self.frontier.filter(self.find_subwebsites(soup)) # skip ones seen this run
         except Exception as e:
             if not silent:
                 print(f'{colors.FAIL}Scrapper: Couldnt scrap {url} :\n{e}\n{colors.ENDC}')
-            return
-        
-        # Finding subwebsite directories
-        directories = []
-        for subwebsite in subwebsites:
+            raise HomepageError(f"couldnt scrap {url}: {e!r}") from e
+
+        # Finding subwebsite directories, as (score, subwebsite, url)
+        candidates = []
+        for subwebsite, subw_page in self.fetcher.iter_pages(subwebsites):
             try:
-                subw_soup = Utility.get_soup(subwebsite)
+                if isinstance(subw_page, Exception):
+                    raise subw_page
                 if not silent:
                     print(f"{colors.OKBLUE}finding staff directories in: {subwebsite} {colors.ENDC}")
-                halflinks = self.find_directories(subw_soup) # halflinks of directories
-                subw_directories = Utility.directories_to_urls(subwebsite, halflinks) # turn halflinks into urls
+                ranked = self.find_directories(Utility.make_soup(subw_page, "links")) # halflinks of directories, scored
+                subw_directories = Utility.directories_to_urls(subwebsite, [halflink for score, halflink in ranked]) # turn halflinks into urls
 
                 if log_info:
-                    if not halflinks:
+                    if not ranked:
                         print(f'{colors.WARNING}no directories{colors.ENDC}')
 
-                for d in subw_directories:
-                    directories.append(d)
+                for (score, halflink), d in zip(ranked, subw_directories):
+                    candidates.append((score, subwebsite, d))
 
             except Exception as e:
+                self.errors += 1
                 if not silent:
                     print(f'{colors.FAIL}Scrapper: Couldnt scrape subwebsite {subwebsite}\nReason: {e} {colors.ENDC}')
 
-        if directories:
-            print(f"\n{colors.OKGREEN}Collected directories, now scrapping them\n{colors.ENDC}")
+        # best-first, a directory linked from many subwebsites is crawled once, for its best link
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        owners = {}
+        keys = set()
+        for score, subwebsite, d in candidates:
+            key = CrawlFrontier.canonicalize(d)
+            if key not in keys:
+                keys.add(key)
+                owners[d] = subwebsite
+        if owners and not silent:
+            print(f"\n{colors.OKGREEN}Collected {len(owners)} directories, now scrapping them\n{colors.ENDC}")
+
+        # budgets per district, and subwebsites whose staff table was already found
+        page_budget = self.settings.get("directory_budget", Scrapper.directory_budget)
+        time_budget = self.settings.get("district_time_budget", Scrapper.district_time_budget)
+        early_stop = self.settings.get("directory_early_stop", True)
+        deadline = monotonic() + time_budget if time_budget else None
+        done = set()
+        crawled = 0
+
+        # handed to the fetcher lazily, so directories of finished subwebsites past the window arent fetched
+        def directories():
+            nonlocal crawled
+            for d in owners:
+                if owners[d] in done or (page_budget and crawled >= page_budget) or (deadline and monotonic() > deadline):
+                    Metrics.count("directories skipped")
+                    continue
+                if not self.frontier.add(d): # crawled already this run, only marked seen once actually crawled
+                    continue
+                crawled += 1
+                yield d
 
-        # Get staff/faculty data from directories
-        # then return in payload
-        payload = [] # return
-        try:
-            for d_url in directories:
-                d_soup = Utility.get_soup(d_url)
+        # Get staff/faculty data from directories, table by table
+        tables = 0
+        for d_url, d_page in self.fetcher.iter_pages(directories()):
+            try:
+                if isinstance(d_page, Exception):
+                    raise d_page
+                if owners[d_url] in done:
+                    Metrics.count("directories skipped") # fetched in the window, but not worth a render and parse
+                    continue
                 if not silent:
                     print(f"{colors.OKBLUE}scrapping directory: {d_url} {colors.ENDC}")
-                
-                dataframes = self.find_staff(d_soup)
 
-                for df in dataframes:
-                    parsed = Parser.parse_table(df)
-                    processed = Parser.process_into_parameters(parsed, id)
-                    payload.append(processed)
+                d_soup = Utility.make_soup(d_page, "staff")
 
+                if self.fingerprints is None:
+                    # records are yielded as each table is normalized, one table is held in memory at a time
+                    confident = False
+                    for records, table_confident in self.extract_tables(d_soup, d_page, id):
+                        confident = confident or table_confident
+                        tables += 1
+                        yield from records
+                else:
+                    # incremental mode, an unchanged directory (and iframes) carries its last records forward
+                    # the whole directory is extracted first, its records are diffed against the last run
+                    previous, processed = None, None
+                    known = self.fingerprints.directory(d_url)
+                    srcs = Extractor.iframe_srcs(d_soup)
+                    # srcs rendered last run are browser tier from the start, host_tiers only lasts a run
+                    for src in known[2] if known is not None else []:
+                        Extractor.host_tiers.setdefault(urlparse(src).netloc, "browser")
+
+                    # a browser-tier src is a constant JS shell fetched statically, it always counts as changed
+                    static = [src for src in srcs if Extractor.host_tiers.get(urlparse(src).netloc) != "browser"]
+                    frames = dict(zip(static, self.fetcher.get_pages(static)))
+                    digest = Fingerprints.digest(d_page, [frames[src] for src in static]) if len(static) == len(srcs) else None
+                    frames = {src: frame for src, frame in frames.items() if not isinstance(frame, Exception)}
+                    rendered = set()
+
+                    if known is not None and digest is not None and known[0] == digest:
+                        Metrics.count("directories unchanged")
+                        processed = [known[1]]
+                        confident = len(known[1]) >= DirectoryRanker.confident_rows
+                    elif known is not None:
+                        previous = known[1]
+
+                    if processed is None:
+                        processed, confident = self.extract(d_soup, d_page, id, frames, rendered)
+
+                        records = [record for table in processed for record in table]
+                        # a directory with rendered iframes is never unchanged next run
+                        digest = None if rendered else digest
+                        changes = self.fingerprints.store_directory(d_url, digest, records, previous, rendered)
+                        for change, n in changes.items():
+                            Metrics.count(f"staff {change}", n)
+                        if previous is not None and not silent:
+                            print(f"{colors.OKCYAN}directory changed: {changes['added']} added, {changes['removed']} removed, {changes['changed']} changed{colors.ENDC}")
+                    del d_soup, d_page
+
+                    while processed:
+                        tables += 1
+                        yield from processed.pop(0)
 
-            if not silent:
-                print(f"{colors.HEADER}Tables scrapped:{len(payload)}")
+            except Exception as e:
+                self.errors += 1
+                Metrics.count("directory errors")
+                if not silent:
+                    print(f"{colors.FAIL}Couldnt scrape directory: {d_url}\nReason: {e} {colors.ENDC}")
+                continue
 
-            return payload
+            if confident and early_stop:
+                done.add(owners[d_url]) # high-confidence staff table, the rest of the subwebsite can go
 
-        except Exception as e:
-            if directories:
-                print(f"{colors.FAIL}Couldnt scrape directory: {d_url}\nReason: {e} {colors.ENDC}")
+        if not silent:
+            print(f"{colors.HEADER}Tables scrapped:{tables}{colors.ENDC}")
 
+    def scrape(self, url, id, **kwargs):
+        """
+        Wrapper over self.scrape_iter()
+        Scrapes a single school website and multiple sub-websites and directories within it (if any).
 
+        The `id` parameter is the place of the url in the excel file, starting from 1.
+        If a `sink` is passed, every record is written to it as soon as its table is processed
+        and nothing is kept in memory.
 
+        Returns:
+            List of StaffRecord (empty when a `sink` is passed),
+            None if the homepage couldnt be scrapped, or nothing was scrapped and subwebsites or directories failed.
 
+        Raises:
+            Any other error, eg of the sink.
 
-    def scrapes(self, **kwargs):
         """
-        Mainloop wrapper over self.scrapper()
-        Takes a list of urls and iterates over them to scrap
+        sink = kwargs.get("sink", None) # for saving records as they come
 
-        `save` is for saving the result to an external file or db
+        payload = [] # return
+        records = 0
+        try:
+            for record in self.scrape_iter(url, id, **kwargs):
+                records += 1
+                if sink is not None:
+                    sink.write(record, url=url)
+                else:
+                    payload.append(record)
+        except HomepageError:
+            return None
+
+        if not records and self.errors:
+            return None # worth another try, unlike a district without staff tables
+
+        return payload
+
+    def work(self, work_queue, worker=0, **kwargs):
+        """
+        Worker loop over self.scrape()
+        Claims district urls from `work_queue` (a WorkQueue) until there are none left,
+        marking each one done or failed once it has been scrapped.
         """
         silent = kwargs.get("silent", False)
         save = kwargs.get("save", True)
+        sink = Scrapper.sinks[self.settings.get("output", "jsonl")](**self.settings) if save else None
+        self.frontier = CrawlFrontier(**self.settings) # new run, new frontier
 
-        # start from where it left
-        with open("config.json", "r") as f:
-            con_dict = json.loads(f.read())
-
-
-        left_at = con_dict["cache"] # pos of url that we left at
-        pos = 1 # pos of url currently iterating on
-
-        for url in urls:
-
-            if pos >= left_at:
-                result = self.scrape(url, pos) # -> payload
-                # save to files
-                if save:
-                    # save result if available
-                    if result:
-                        with open("data.json", "r") as f:
-                            data_dict = json.loads(f.read())
-                        with open("data.json", "w") as f:
-                            data_dict[url] = result
-                            f.write(f"\n{json.dumps(data_dict)}\n")
-
-                # save pos to remember where to start from next time
-                with open("config.json", "w") as f:
-                    con_dict["cache"] = pos
-                    f.write(json.dumps(con_dict))
-                pos += 1
-            else:
-                pos += 1
+        while True:
+            item = work_queue.claim(worker)
+            if item is None:
+                break
+            pos, url = item
+
+            try:
+                snapshot = Metrics.snapshot() if Metrics.enabled else None
+                start = monotonic()
+                result = self.scrape(url, pos, sink=sink) # records are saved by the sink
+                if sink is not None:
+                    sink.flush() # district is done, make sure it is on disk
+                if Metrics.enabled:
+                    Metrics.district_report(url, snapshot, monotonic() - start)
+            except Exception as e:
+                work_queue.fail(pos, repr(e))
                 continue
 
+            if result is None:
+                work_queue.fail(pos, f"no records, {self.errors} subwebsites or directories failed" if self.errors else "scrape returned nothing")
+            else:
+                work_queue.done(pos)
+
+        if sink is not None:
+            sink.close()
 
+        if not silent:
+            tiers = Extractor.tier_counts
+            print(f"{colors.OKCYAN}iframe pages: {tiers['static']} static, {tiers['browser']} rendered in browser{colors.ENDC}")
+            if Utility.http_cache is not None:
+                print(f"{colors.OKCYAN}{Utility.http_cache.report()}{colors.ENDC}")
+            print(f"{colors.OKCYAN}{self.frontier.report()}{colors.ENDC}")
+            print(f"{colors.OKCYAN}{self.fetcher.health.report()}{colors.ENDC}")
+            if self.fetcher.proxies is not None:
+                print(f"{colors.OKCYAN}{self.fetcher.proxies.report()}{colors.ENDC}")
 
+    def scrapes(self, **kwargs):
+        """
+        Mainloop wrapper over self.scrape()
+        Takes the list of urls and scrapes them through a durable WorkQueue (queue.db).
+        A stopped or crashed run picks up where it left, retrying only the urls that were in progress.
 
+        `save` is for saving the result to an external file or db
+        Records are appended to data.jsonl (see `JsonlSink`) as soon as they are scrapped,
+        or upserted into staff.db with the `output` setting set to "sqlite" (see `SqliteSink`)
+
+        `workers` is the number of worker processes, each with its own Scrapper.
+        1 (the default) scrapes in this process, 0 uses one worker per core.
+        """
+        silent = kwargs.get("silent", False)
+        workers = kwargs.get("workers", self.settings.get("workers", 1))
+        if workers == 0:
+            workers = os.cpu_count() or 1
+
+        work_queue = WorkQueue(**self.settings)
+        # positions before the old config.json `cache` were already scrapped
+        work_queue.seed(Utility.get_urls(), done_before=self.settings.get("cache", 1))
+        recovered = work_queue.recover()
+        if recovered and not silent:
+            print(f"{colors.WARNING}retrying {recovered} urls that were in progress when the last run stopped{colors.ENDC}")
+
+        if workers <= 1:
+            self.work(work_queue, **kwargs)
+        else:
+            processes = []
+            for worker in range(workers):
+                # spawned, a fork would inherit the fetcher loop, the proxy checker and open sqlite connections
+                process = multiprocessing.get_context("spawn").Process(target=scrape_worker, args=(worker, self.settings, kwargs))
+                process.start()
+                processes.append(process)
+
+            for process in processes:
+                process.join()
+
+        if not silent:
+            counts = work_queue.counts()
+            print(f"{colors.OKCYAN}urls: {counts}{colors.ENDC}")
+        work_queue.close()
+
+
+# Entry point of a worker process started by Scrapper.scrapes
+# Workers are spawned, so they start with none of the parent's Metrics, fetcher or connections
+def scrape_worker(worker, settings, kwargs):
+    # one trace file and metrics port per worker
+    if settings.get("metrics_trace"):
+        settings = {**settings, "metrics_trace": f"{settings['metrics_trace']}.{worker}"}
+    if settings.get("metrics_port"):
+        settings = {**settings, "metrics_port": settings["metrics_port"] + 1 + worker}
+    # a parquet file has a single writer
+    if settings.get("output") == "parquet":
+        settings = {**settings, "parquet_path": f"{settings.get('parquet_path', ParquetSink.path)}.{worker}"}
+    scrapper = Scrapper(**settings)
+    work_queue = WorkQueue(**settings)
+    try:
+        scrapper.work(work_queue, worker, **kwargs)
+    finally:
+        work_queue.close()
+        scrapper.close()
 
 
 ### Main
 ## Console Interface
 def console():
     scrapper = Scrapper()
-    msg = f"{colors.OKCYAN}webscrapper Console\n{colors.UNDERLINE}COMMANDS{colors.ENDC}{colors.OKCYAN}:\n1) start : start the webscrapper\n2) reset cache : reset count and start from pos 1\n3) reset data : reset data.json"
+    msg = f"{colors.OKCYAN}webscrapper Console\n{colors.UNDERLINE}COMMANDS{colors.ENDC}{colors.OKCYAN}:\n1) start : start the webscrapper\n2) reset cache : reset count and start from pos 1\n3) reset data : reset data.jsonl\n4) compact data : drop duplicate records from data.jsonl\n5) retry failed : scrape failed urls again on the next start\n6) export csv / export parquet : export staff.db (the sqlite output)"
     print(msg)
     while True:
         com = input(">>>").lower()
@@ -724,16 +3207,47 @@ def console():
         if com == "start":
             scrapper.scrapes()
         elif com == "reset cache":
+            con_dict = Utility.get_config()
+            con_dict["cache"] = 1
             with open("config.json", "w") as f:
-                f.write(json.dumps({"cache": 1}))
+                f.write(json.dumps(con_dict))
+            work_queue = WorkQueue(**con_dict)
+            work_queue.reset()
+            work_queue.close()
+        elif com == "retry failed":
+            work_queue = WorkQueue(**Utility.get_config())
+            print(f"{colors.OKGREEN}{work_queue.retry_failed()} failed urls are pending again{colors.ENDC}")
+            work_queue.close()
         elif com == "reset data":
-            with open("data.json", "w") as f:
-                f.write(json.dumps({}))
+            with open(JsonlSink.path, "w") as f:
+                pass
+        elif com == "compact data":
+            kept, dropped = JsonlSink.compact()
+            print(f"{colors.OKGREEN}kept {kept} records, dropped {dropped} duplicates{colors.ENDC}")
+        elif com in ("export csv", "export parquet"):
+            out = f"staff.{com.split()[1]}"
+            rows = SqliteSink.export(out, Utility.get_config().get("store_path"))
+            print(f"{colors.OKGREEN}exported {rows} records to {out}{colors.ENDC}")
         else:
             print(f"{colors.FAIL}Unknown command '{com}'{colors.ENDC}")
 
-console()
-"""
-todo
-NER method
-"""
+# Time `import main` in a fresh interpreter against `budget` seconds
+# Also fails if the import pulled in Selenium or spaCy
+def check_cold_start(budget=cold_start_budget):
+    here = os.path.dirname(os.path.abspath(__file__))
+    probe = "import sys, time; t = time.perf_counter(); import main; print(time.perf_counter() - t); print(','.join(m for m in ('selenium', 'spacy') if m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", probe], cwd=here, capture_output=True, text=True, check=True).stdout.split("\n")
+    took, heavy = float(out[0]), out[1]
+
+    ok = took <= budget and not heavy
+    color = colors.OKGREEN if ok else colors.FAIL
+    print(f"{color}import main: {took:.3f}s (budget {budget}s){colors.ENDC}")
+    if heavy:
+        print(f"{colors.FAIL}imported at startup: {heavy}{colors.ENDC}")
+    return ok
+
+
+if __name__ == "__main__":
+    if "--cold-start" in sys.argv:
+        sys.exit(0 if check_cold_start() else 1)
+    console()